@@ -1,15 +1,25 @@
-import streamlit as st
-import re
+import time
+
 import networkx as nx
-from pyvis.network import Network
-from openai import OpenAI
-import json
 import pandas as pd
-from pytrends.request import TrendReq
+import streamlit as st
 
-# ─── CONFIG ────────────────────────────────────────────
-openai_client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-pytrends = TrendReq(hl='en-US', tz=360)
+import dedup
+import persistent_cache
+import telemetry
+from breaker import get_breaker
+from bulk import iter_parent_weights
+from graph import MAX_CONCURRENCY, NODE_BUDGET, REQUEST_BUDGET, SCORERS, expand_node, graph_rows, iter_build_graph
+from hedging import get_hedger
+from jobs import get_job_store, is_running, start_job, stop_job
+from layout import LAYOUTS
+from llm import API_CALLS, BATCH_SIZE, PARSE_STATS
+from render import WEBGL_SUGGEST_NODES, draw_pyvis, draw_webgl, graph_delta, render_cache, stream_graph
+from scheduler import get_scheduler
+from singleflight import flights
+
+# Heavy work lives in the imported modules, which Streamlit executes once per
+# process; this script is re-run on every interaction and only builds the UI.
 
 # ─── STREAMLIT PAGE SETUP ──────────────────────────────
 st.set_page_config(layout="wide")
@@ -28,118 +38,8 @@ st.markdown(
     ''', unsafe_allow_html=True
 )
 
-# ─── HELPERS ────────────────────────────────────────────
-@st.cache_data
-def get_llm_neighbors(term: str, rel: str, limit: int) -> list[str]:
-    if rel == "subtopic":
-        prompt = f"Provide a JSON array of up to {limit} concise, distinct subtopics of '{term}'."
-    elif rel == "related":
-        prompt = f"Provide a JSON array of up to {limit} concise, distinct concepts related to but not subtopics of '{term}'."
-    elif rel == "related_question":
-        prompt = f"Provide a JSON array of up to {limit} distinct user search queries (as questions) related to '{term}'."
-    else:
-        return []
-    resp = openai_client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "Output only a JSON array of strings."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7
-    )
-    content = resp.choices[0].message.content
-    try:
-        arr = json.loads(content)
-        return [str(i) for i in arr][:limit]
-    except json.JSONDecodeError:
-        return [re.sub(r"^[-•\s]+", "", l).strip() for l in content.splitlines() if l][:limit]
-
-@st.cache_data
-def find_parent_topics(topic: str, limit: int = 5) -> list[str]:
-    prompt = (
-        f"Provide a JSON array of up to {limit} higher-level topics or domains that '{topic}' is a subtopic of."
-    )
-    resp = openai_client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "Output only a JSON array of strings."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0
-    )
-    try:
-        arr = json.loads(resp.choices[0].message.content)
-        return [str(p) for p in arr][:limit]
-    except:
-        return []
-
-@st.cache_data
-def find_parent_topic_weights(topic: str, candidates: list[str]) -> pd.DataFrame:
-    prompt = (
-        f"For the topic '{topic}', assign a relevance score from 0 to 100 to each of the following higher-level domains: "
-        f"{', '.join(candidates)}. Respond only as JSON array of objects with 'parent' and 'score' fields."
-    )
-    resp = openai_client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "Output only valid JSON."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0
-    )
-    try:
-        arr = json.loads(resp.choices[0].message.content)
-        df = pd.DataFrame(arr)
-        df['score'] = pd.to_numeric(df['score'], errors='coerce').fillna(0).astype(int)
-        return df.sort_values('score', ascending=False).reset_index(drop=True)
-    except Exception:
-        df = pd.DataFrame({'parent': candidates, 'score': [100//len(candidates)]*len(candidates)})
-        return df.sort_values('score', ascending=False).reset_index(drop=True)
-
-# ─── GRAPH BUILDER ──────────────────────────────────────
-def build_graph(seed, sub_depth, max_sub, max_rel, sem_sub_lim, include_q, max_q):
-    G = nx.Graph()
-    G.add_node(seed, label=seed, rel="seed", depth=0)
-    for t in get_llm_neighbors(seed, "subtopic", max_sub):
-        G.add_node(t, label=t, rel="subtopic", depth=1)
-        G.add_edge(seed, t)
-    if sub_depth > 1:
-        for node in list(G.nodes):
-            if G.nodes[node]['rel'] == 'subtopic':
-                for sub in get_llm_neighbors(node, "subtopic", max(1, max_sub//2)):
-                    if not G.has_node(sub):
-                        G.add_node(sub, label=sub, rel="subtopic", depth=G.nodes[node]['depth']+1)
-                    G.add_edge(node, sub)
-    for rel in get_llm_neighbors(seed, "related", max_rel):
-        G.add_node(rel, label=rel, rel="related", depth=1)
-        G.add_edge(seed, rel)
-        for subr in get_llm_neighbors(rel, "related", sem_sub_lim):
-            if not G.has_node(subr):
-                G.add_node(subr, label=subr, rel="related", depth=2)
-            G.add_edge(rel, subr)
-    if include_q:
-        for q in get_llm_neighbors(seed, "related_question", max_q):
-            G.add_node(q, label=q, rel="related_question", depth=1)
-            G.add_edge(seed, q)
-    return G
-
-# ─── VISUALIZE WITH PYVIS ───────────────────────────────
-def draw_pyvis(G: nx.Graph) -> str:
-    net = Network(height="750px", width="100%", notebook=False)
-    options_json = json.dumps({
-        "interaction": {"hover": True, "navigationButtons": True},
-        "physics": {"stabilization": {"iterations": 300}}
-    })
-    net.set_options(options_json)
-    colors = {"seed": "#1f78b4", "subtopic": "#66c2a5", "related": "#61b2ff", "related_question": "#ffcc61"}
-    for node, data in G.nodes(data=True):
-        title = f"{data['rel']} (depth {data['depth']})"
-        net.add_node(node, label=data['label'], title=title, color=colors.get(data['rel'], "#999999"))
-    for u, v in G.edges():
-        net.add_edge(u, v)
-    return net.generate_html()
-
 # ─── STREAMLIT APP UI ──────────────────────────────────
+GRAPH_HISTORY = 5  # recent graphs kept per session
 st.title("Knowledge Graph Generator")
 
 tab1, tab2 = st.tabs(["Knowledge Graph","Bulk Parent Topic Weigher"])
@@ -153,35 +53,218 @@ with tab1:
         include_q = st.checkbox("Include questions", True)
         show_adv = st.checkbox("Advanced settings")
         if show_adv:
-            sub_depth = st.slider("Subtopic depth", 1, 2, 1)
+            sub_depth = st.slider("Subtopic depth", 1, 5, 1)
             max_q = st.slider("# questions", 5, 50, 20)
             sem_sub_lim = st.slider("2nd level related", 0, max_rel, max_rel//2)
+            max_workers = st.slider("Concurrent requests", 1, 32, MAX_CONCURRENCY)
+            batch_size = st.slider("Terms per request", 1, 20, BATCH_SIZE)
+            stream = st.checkbox("Stream answers", True, help="Show the seed's neighbors as they are generated "
+                                                             "instead of when each list is complete.")
+            node_budget = st.slider("Node budget", 50, 5000, NODE_BUDGET, disabled=sub_depth == 1,
+                                    help="Subtopic expansion stops once the graph has this many nodes.")
+            request_budget = st.slider("Request budget", 5, 1000, REQUEST_BUDGET, disabled=sub_depth == 1,
+                                       help="Maximum completions spent on subtopics below depth 1.")
+            scorer = st.selectbox("Expand first", list(SCORERS), disabled=sub_depth == 1,
+                                  format_func=lambda s: s.replace("_", " "))
+            renderer = st.selectbox("Renderer", ["pyvis", "WebGL"],
+                                    help="WebGL draws tens of thousands of nodes smoothly; pyvis is richer but slows down past a few thousand.")
+            layout = st.selectbox("Layout", [*LAYOUTS, "browser"],
+                                  help="auto / numpy / radial / networkx lay the graph out on the server; browser runs vis.js physics (pyvis only).")
+            merge_dupes = st.checkbox("Merge near-duplicates", False, disabled=not dedup.available(),
+                                      help="Needs the extras in requirements-embeddings.txt.")
+            dup_threshold = st.slider("Similarity threshold", 0.70, 0.99, dedup.DEFAULT_THRESHOLD,
+                                      disabled=not merge_dupes)
         else:
             sub_depth, max_q, sem_sub_lim = 1, 20, max_rel//2
+            max_workers, batch_size, stream = MAX_CONCURRENCY, BATCH_SIZE, True
+            node_budget, request_budget, scorer = NODE_BUDGET, REQUEST_BUDGET, "depth_decay"
+            merge_dupes, dup_threshold = False, dedup.DEFAULT_THRESHOLD
+            renderer, layout = "pyvis", "auto"
+    history = st.session_state.setdefault("graphs", [])
+    if get_breaker().is_open:
+        st.warning(f"The LLM API is failing; calls are paused for {get_breaker().snapshot()['retry_in_s']:.0f}s. "
+                   "Graphs are built from cached answers only.")
     if st.sidebar.button("Generate Graph"):
-        G = build_graph(seed, sub_depth, max_sub, max_rel, sem_sub_lim, include_q, max_q)
-        st.success(f"Nodes: {len(G.nodes)}   Edges: {len(G.edges)}")
-        html = draw_pyvis(G)
-        st.components.v1.html(html, height=800, scrolling=True, width=2000)
-        df = pd.DataFrame([{'Topic':d['label'],'Type':d['rel'],'Depth':d['depth']} for _,d in G.nodes(data=True)])
-        st.download_button("Download CSV", df.to_csv(index=False), "graph.csv", "text/csv")
+        G = nx.Graph()
+        status, live = st.empty(), st.empty()
+        deltas, last_draw = [], 0.0
+        index = dedup.SemanticIndex(dup_threshold) if merge_dupes else None
+        with telemetry.run(seed) as run:
+            for delta in iter_build_graph(G, seed, sub_depth, max_sub, max_rel, sem_sub_lim, include_q, max_q,
+                                          max_workers, batch_size, node_budget, request_budget, scorer, index,
+                                          stream):
+                deltas.append(delta)
+                now = time.monotonic()
+                if now - last_draw > 0.5:
+                    # Each push is a new frame (its id comes from its args), so it gets
+                    # the whole history; the throttle keeps the number of pushes down.
+                    status.info(f"Expanding…   Nodes: {len(G.nodes)}   Edges: {len(G.edges)}")
+                    with live:
+                        stream_graph(deltas)
+                    last_draw = now
+            with live:
+                stream_graph(deltas)
+        status.empty()
+        live.empty()
+        merged = f"   Merged near-duplicates: {index.merged}" if index else ""
+        history.insert(0, {"seed": seed, "G": G, "index": index, "merged": merged, "built": time.strftime("%H:%M:%S"),
+                           "usage": run.summary(), "totals": run.totals(),
+                           "id": st.session_state.setdefault("graph_seq", 0)})
+        st.session_state["graph_seq"] += 1
+        del history[GRAPH_HISTORY:]
+        st.session_state["graph_choice"] = 0
+    # Everything below works on stored graphs: widget reruns, filters and
+    # downloads never trigger another expansion.
+    if history:
+        choice = st.selectbox("Graph", range(len(history)), key="graph_choice",
+                              format_func=lambda i: f"{history[i]['seed']}  ({len(history[i]['G'])} nodes, {history[i]['built']})")
+        entry = history[choice]
+        G = entry["G"]
+        summary = st.empty()
+        explore = st.toggle("Click to expand", help="Click a node to fetch its subtopics and related terms. "
+                                                    "Only the new nodes are sent to the browser.")
+        types = sorted({d['rel'] for _, d in G.nodes(data=True)})
+        shown = st.multiselect("Show types", types, types, disabled=explore)
+        if set(shown) != set(types) and not explore:
+            G = G.subgraph([n for n, d in G.nodes(data=True) if d['rel'] in shown]).copy()
+        if explore:
+            key = f"explore-{entry['id']}"
+            deltas = entry.setdefault("deltas", [graph_delta(G)])
+            clicked = st.session_state.get(key) or {}
+            if clicked.get("node") in G and clicked["click"] != entry.get("click"):
+                entry["click"] = clicked["click"]
+                with st.spinner(f"Expanding {clicked['node']}…"):
+                    deltas.append(expand_node(G, clicked["node"], max_sub, max_rel, entry["index"]))
+            sent = min(clicked.get("applied", 0), len(deltas))
+            stream_graph(deltas[sent:], sent, clickable=True, key=key)
+            st.caption(f"Expanded {len(deltas) - 1} nodes this session.")
+        elif renderer == "WebGL":
+            html = draw_webgl(G, "auto" if layout == "browser" else layout)
+        else:
+            if len(G) > WEBGL_SUGGEST_NODES:
+                st.warning(f"{len(G)} nodes: the WebGL renderer (Advanced settings) will be much smoother.")
+            html = draw_pyvis(G, None if layout == "browser" else layout)
+        if not explore:
+            st.components.v1.html(html, height=800, scrolling=True, width=2000)
+        summary.success(f"Nodes: {len(G.nodes)}   Edges: {len(G.edges)}{entry['merged']}")
+        missing = sum(bool(d.get('missing')) for _, d in G.nodes(data=True))
+        if missing:
+            st.warning(f"{missing} nodes (dashed red outline) have branches that could not be fetched while the "
+                       "LLM API was unavailable. Click to expand them once it recovers.")
+        with st.expander("Calls, tokens and cost"):
+            t = entry["totals"]
+            st.caption(f"{t['calls']} completions · {t['cache_hits']} persistent-cache hits · "
+                       f"{t['prompt_tokens'] + t['completion_tokens']} tokens · ${t['cost_usd']:.4f}")
+            st.dataframe(pd.DataFrame(entry["usage"]), hide_index=True)
+        df = pd.DataFrame(graph_rows(G))
+        st.download_button("Download CSV", df.to_csv(index=False), f"{entry['seed']}.csv", "text/csv")
+    with st.sidebar.expander("Completion cache"):
+        st.json(persistent_cache.get_backend().stats.as_dict())
+        st.caption("Coalesced in-flight calls")
+        st.json(flights.snapshot())
+        st.caption("Rejected answers (retried, never cached)")
+        st.json(PARSE_STATS)
+    with st.sidebar.expander("Rate limiter"):
+        st.json(get_scheduler().snapshot())
+    with st.sidebar.expander("Hedged requests"):
+        st.json(get_hedger().snapshot())
+    with st.sidebar.expander("Circuit breaker"):
+        st.json(get_breaker().snapshot())
+    with st.sidebar.expander("Render cache"):
+        st.json(render_cache.snapshot())
 
 with tab2:
     st.header("Bulk Parent Topic Weigher")
     topics_input = st.text_area("Enter topics (one per line)", "etl process")
+    upload = st.file_uploader("…or upload a topic list (one per line)", type=["txt", "csv"])
+    if upload is not None:
+        topics_input = upload.getvalue().decode("utf-8", errors="replace")
     topics = [t.strip() for t in topics_input.splitlines() if t.strip()]
-    if st.button("Compute Weights"):
-        results = []
-        for topic in topics:
-            parents = find_parent_topics(topic)
-            if parents:
-                weights_df = find_parent_topic_weights(topic, parents)
-                sorted_parents = list(weights_df['parent'])
+    bulk_workers = st.slider("Parallel workers", 1, 32, MAX_CONCURRENCY)
+    durable = st.checkbox("Durable job", help="Store results on disk in chunks; the job keeps running if the "
+                                              "browser disconnects and resumes after a restart.")
+    mode = st.radio("Mode", ["Two-step", "Fused"] if durable else ["Two-step", "Fused", "Compare both"],
+                    horizontal=True, help="Fused asks for parents and scores in one completion.")
+
+    def run_bulk(fused: bool) -> dict:
+        results = {}
+        progress, stats, table = st.progress(0.0), st.empty(), st.empty()
+        calls_before = API_CALLS["count"]
+        started = last_draw = time.monotonic()
+        with telemetry.run("bulk") as run:
+            for i, row in iter_parent_weights(topics, bulk_workers, fused):
+                results[i] = row
+                now = time.monotonic()
+                rate = len(results) / max(now - started, 1e-6)
+                progress.progress(len(results) / len(topics))
+                stats.caption(f"{len(results)}/{len(topics)} rows · {rate:.1f} rows/sec · "
+                              f"ETA {(len(topics) - len(results)) / rate:.0f}s")
+                if now - last_draw > 0.5 or len(results) == len(topics):
+                    table.dataframe(pd.DataFrame([results[k] for k in sorted(results)]))
+                    last_draw = now
+        elapsed = time.monotonic() - started
+        t = run.totals()
+        stats.caption(f"{len(results)} rows in {elapsed:.1f}s · {API_CALLS['count'] - calls_before} API calls · "
+                      f"{t['prompt_tokens'] + t['completion_tokens']} tokens · ${t['cost_usd']:.4f}")
+        return results
+
+    if st.button("Compute Weights") and topics:
+        if durable:
+            jid = get_job_store().create(topics, mode == "Fused", upload.name if upload else "")
+            start_job(jid, bulk_workers)
+            st.session_state["bulk_job"] = jid
+        elif mode == "Compare both":
+            left, right = st.columns(2)
+            with left:
+                st.subheader("Two-step")
+                two_step = run_bulk(False)
+            with right:
+                st.subheader("Fused")
+                fused = run_bulk(True)
+            agree = sum(two_step[i].get('Parent 1') == fused[i].get('Parent 1') for i in two_step)
+            st.caption(f"Top parent agrees on {agree}/{len(topics)} topics")
+        else:
+            run_bulk(mode == "Fused")
+
+    # ─── DURABLE JOBS ──────────────────────────────────
+    @st.cache_data(max_entries=2)
+    def job_csv(jid: str, done: int) -> bytes:
+        # Keyed on the row count, so the 2 s progress refresh rebuilds it only
+        # when rows have been added.
+        return pd.DataFrame(get_job_store().iter_rows(jid)).to_csv(index=False).encode()
+
+    job_list = get_job_store().jobs()
+    if job_list:
+        st.subheader("Jobs")
+        ids = [j["id"] for j in job_list]
+        names = {j["id"]: f"{j['name']} · {j['total']} topics · {'fused' if j['fused'] else 'two-step'}" for j in job_list}
+        if st.session_state.get("bulk_job") not in ids:
+            st.session_state["bulk_job"] = ids[0]
+        jid = st.selectbox("Job", ids, key="bulk_job", format_func=names.get)
+
+        @st.fragment(run_every=2)
+        def job_progress():
+            store = get_job_store()
+            p = store.progress(jid)
+            running = is_running(jid)
+            state = "finished" if p["finished"] else "running" if running else "paused"
+            st.progress(p["done"] / max(p["total"], 1))
+            st.caption(f"{p['done']}/{p['total']} rows · {p['errors']} errors · {state}")
+            st.dataframe(pd.DataFrame(store.rows(jid, 50, newest=True)))
+            cols = st.columns(4)
+            # Only offered while the job is stopped, so the export is not rebuilt
+            # on every refresh while rows keep arriving.
+            if p["done"] and not running:
+                cols[3].download_button("Download CSV", job_csv(jid, p["done"]), f"parents-{jid}.csv", "text/csv")
             else:
-                sorted_parents = []
-            row = {'Topic': topic}
-            for i, p in enumerate(sorted_parents, start=1):
-                row[f'Parent {i}'] = p
-            results.append(row)
-        out_df = pd.DataFrame(results)
-        st.dataframe(out_df)
+                cols[3].download_button("Download CSV", b"", disabled=True,
+                                        help="Available once the job is paused or finished")
+            if not running and not p["finished"] and cols[0].button("Resume"):
+                start_job(jid, bulk_workers)
+            if running and cols[1].button("Pause"):
+                stop_job(jid)
+            if not running and p["errors"] and cols[2].button(f"Retry {p['errors']} errors"):
+                store.retry_errors(jid)
+                start_job(jid, bulk_workers)
+
+        job_progress()
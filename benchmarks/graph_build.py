@@ -0,0 +1,132 @@
+"""Offline graph-build, render and bulk-weigher benchmark.
+
+Runs build_graph, draw_pyvis and the bulk parent weigher against the
+deterministic fake LLM backend across a matrix of max_sub / max_rel /
+sub_depth settings. Each cell runs cold (empty caches) and then warm.
+
+    python -m benchmarks.graph_build --latency 0.3 --max-sub 10 20 --sub-depth 1 2
+"""
+import argparse
+import itertools
+import json
+import sys
+import tempfile
+import time
+
+from headless import quiet_streamlit
+
+quiet_streamlit()
+
+import streamlit as st  # noqa: E402
+
+import llm  # noqa: E402
+import persistent_cache  # noqa: E402
+from bulk import iter_parent_weights  # noqa: E402
+from fake_llm import FakeLLMBackend  # noqa: E402
+from graph import MAX_CONCURRENCY, build_graph  # noqa: E402
+from render import draw_pyvis, render_cache  # noqa: E402
+
+
+def _clear_memo() -> None:
+    # In-process caches only: warm runs then measure the persistent layer and a
+    # full render rather than memoized results.
+    st.cache_data.clear()
+    render_cache.clear()
+
+
+def _reset_caches(path: str) -> persistent_cache.CacheBackend:
+    _clear_memo()
+    backend = persistent_cache.SQLiteCache(path)
+    persistent_cache.set_backend(backend)
+    return backend
+
+
+def _run_graph(fake: FakeLLMBackend, cache: persistent_cache.CacheBackend, args, max_sub, max_rel, sub_depth) -> dict:
+    calls_before = fake.calls
+    hits_before, misses_before = cache.stats.hits, cache.stats.misses
+    started = time.perf_counter()
+    G = build_graph(args.seed_term, sub_depth, max_sub, max_rel, max_rel // 2, True, args.max_q,
+                    args.workers, args.batch_size)
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    draw_pyvis(G)
+    render_s = time.perf_counter() - started
+    hits, misses = cache.stats.hits - hits_before, cache.stats.misses - misses_before
+    return {
+        "nodes": G.number_of_nodes(),
+        "edges": G.number_of_edges(),
+        "build_s": round(build_s, 3),
+        "render_s": round(render_s, 3),
+        "requests": fake.calls - calls_before,
+        "cache_hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+    }
+
+
+def _run_bulk(fake: FakeLLMBackend, args, fused: bool) -> dict:
+    topics = [f"topic {i}" for i in range(args.bulk_topics)]
+    calls_before = fake.calls
+    started = time.perf_counter()
+    rows = sum(1 for _ in iter_parent_weights(topics, args.workers, fused))
+    elapsed = time.perf_counter() - started
+    return {"rows": rows, "seconds": round(elapsed, 3), "rows_per_s": round(rows / max(elapsed, 1e-9), 1),
+            "requests": fake.calls - calls_before}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed-term", default="data warehouse")
+    parser.add_argument("--max-sub", type=int, nargs="+", default=[10, 20])
+    parser.add_argument("--max-rel", type=int, nargs="+", default=[10, 20])
+    parser.add_argument("--sub-depth", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--max-q", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=llm.BATCH_SIZE)
+    parser.add_argument("--bulk-topics", type=int, default=50, help="0 skips the bulk weigher benchmark")
+    parser.add_argument("--latency", type=float, default=0.05, help="median fake completion latency (s)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of calls answered with a 429")
+    parser.add_argument("--rng-seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    fake = FakeLLMBackend(args.rng_seed, args.latency, args.latency_sigma, args.error_rate, args.malformed_rate,
+                          args.rate_limit_rate)
+    llm.set_llm_backend(fake)
+    results = {"graph": [], "bulk": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'sub':>4}{'rel':>5}{'depth':>6}{'run':>6}{'nodes':>7}{'edges':>7}"
+              f"{'build s':>9}{'render s':>10}{'reqs':>6}{'hit rate':>10}")
+        for i, (max_sub, max_rel, sub_depth) in enumerate(
+                itertools.product(args.max_sub, args.max_rel, args.sub_depth)):
+            cache = _reset_caches(f"{tmp}/cell{i}.sqlite3")
+            for run in ("cold", "warm"):
+                cell = {"max_sub": max_sub, "max_rel": max_rel, "sub_depth": sub_depth, "run": run}
+                try:
+                    cell.update(_run_graph(fake, cache, args, max_sub, max_rel, sub_depth))
+                except Exception as e:
+                    cell["error"] = repr(e)
+                    print(f"{max_sub:>4}{max_rel:>5}{sub_depth:>6}{run:>6}  error: {e!r}")
+                    results["graph"].append(cell)
+                    continue
+                results["graph"].append(cell)
+                print(f"{max_sub:>4}{max_rel:>5}{sub_depth:>6}{run:>6}{cell['nodes']:>7}{cell['edges']:>7}"
+                      f"{cell['build_s']:>9.3f}{cell['render_s']:>10.3f}{cell['requests']:>6}"
+                      f"{cell['cache_hit_rate']:>10.3f}")
+                _clear_memo()
+        if args.bulk_topics:
+            print(f"\n{'bulk mode':<10}{'rows':>6}{'seconds':>9}{'rows/s':>8}{'reqs':>6}")
+            for fused in (False, True):
+                _reset_caches(f"{tmp}/bulk{int(fused)}.sqlite3")
+                row = {"mode": "fused" if fused else "two-step", **_run_bulk(fake, args, fused)}
+                results["bulk"].append(row)
+                print(f"{row['mode']:<10}{row['rows']:>6}{row['seconds']:>9.3f}{row['rows_per_s']:>8}{row['requests']:>6}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
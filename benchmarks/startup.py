@@ -0,0 +1,64 @@
+"""Cold-start import benchmark.
+
+Imports each app module in a fresh interpreter and checks the wall-clock time
+against a budget. Run from the repository root:
+
+    python -m benchmarks.startup [--repeat N]
+
+Exits non-zero when a module, or the full app import set, is over budget.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Seconds per cold import, measured in a new process so nothing is pre-cached.
+# Budgets for app modules include their third-party imports (streamlit, pandas).
+BUDGETS = {
+    "persistent_cache": 0.15,
+    "llm": 2.5,
+    "graph": 2.5,
+    "bulk": 2.5,
+    "render": 2.5,
+}
+TOTAL_BUDGET = 3.0
+HEAVY_MODULES = ("openai", "pyvis", "torch", "transformers", "sentence_transformers", "pytrends")
+
+_PROBE = """
+import sys, time
+t = time.perf_counter()
+for m in sys.argv[1:]:
+    __import__(m)
+print(time.perf_counter() - t)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def time_import(modules: list[str]) -> tuple[float, list[str]]:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(heavy=HEAVY_MODULES), *modules],
+        capture_output=True, text=True, check=True,
+    ).stdout.split("\n")
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per module; the median is reported")
+    args = parser.parse_args(argv)
+
+    failed = False
+    rows = [(m, [m], BUDGETS[m]) for m in BUDGETS] + [("(all)", list(BUDGETS), TOTAL_BUDGET)]
+    print(f"{'module':<18}{'median s':>10}{'budget s':>10}  heavy imports")
+    for name, modules, budget in rows:
+        runs = [time_import(modules) for _ in range(args.repeat)]
+        median = statistics.median(t for t, _ in runs)
+        heavy = runs[-1][1]
+        over = median > budget or bool(heavy)
+        failed |= over
+        print(f"{name:<18}{median:>10.3f}{budget:>10.2f}  {', '.join(heavy) or '-'}{'  OVER' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+# Circuit breaker in front of the LLM API. After KG_BREAKER_FAILURES attempts
+# in a row have failed (timeouts, dropped connections, 5xx; rate limits are the
+# scheduler's business and do not count), the breaker opens: new calls and
+# pending retries fail fast with CircuitOpen for KG_BREAKER_COOLDOWN seconds; graphs
+# are then built from cached answers only, with the branches that could not be
+# fetched marked on their nodes. After the cool-down one probe call is let
+# through: success closes the breaker, failure opens it for another cool-down.
+# KG_BREAKER_FAILURES=0 disables it.
+
+
+class CircuitOpen(Exception):
+    """The LLM API is not being called: too many recent failures."""
+
+
+@dataclass
+class BreakerStats:
+    failures: int = 0
+    opened: int = 0
+    rejected: int = 0  # calls refused while open
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = 5, cooldown: float = 30.0):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.stats = BreakerStats()
+        self._streak = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        env = os.environ.get
+        return cls(failures=int(env("KG_BREAKER_FAILURES", 5)), cooldown=float(env("KG_BREAKER_COOLDOWN", 30)))
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if now - self._opened_at < self.cooldown else "half_open"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def _admit(self) -> tuple[bool, bool]:
+        # (allowed, probe): half-open lets one probe through at a time.
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True, False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True, True
+            self.stats.rejected += 1
+            return False, False
+
+    def success(self) -> None:
+        with self._lock:
+            self._streak = 0
+            self._opened_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self.stats.failures += 1
+            self._streak += 1
+            state = self._state(time.monotonic())
+            if self.threshold and (state == "half_open" or (state == "closed" and self._streak >= self.threshold)):
+                self._opened_at = time.monotonic()
+                self.stats.opened += 1
+
+    def call(self, fn):
+        """fn() if the breaker admits a call now; fn reports each attempt with
+        success() or failure()."""
+        if not self.threshold:
+            return fn()
+        allowed, probe = self._admit()
+        if not allowed:
+            raise CircuitOpen(f"LLM API calls paused after {self.threshold} failures in a row")
+        try:
+            return fn()
+        finally:
+            if probe:
+                with self._lock:
+                    self._probing = False  # whatever happened, the next probe may go
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            retry_in = self.cooldown - (now - self._opened_at) if state == "open" else 0.0
+            return {**asdict(self.stats), "state": state, "failure_streak": self._streak,
+                    "retry_in_s": round(retry_in, 1)}
+
+
+# Process-wide, like the scheduler: an outage is shared by every session.
+_breaker: CircuitBreaker | None = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker.from_env()
+        return _breaker
+
+
+def set_breaker(breaker: CircuitBreaker) -> None:
+    global _breaker
+    with _breaker_lock:
+        _breaker = breaker
@@ -0,0 +1,53 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import telemetry
+from graph import MAX_CONCURRENCY
+from llm import UNAVAILABLE, _parent_topic_weights, _parent_topics, _parents_fused
+
+# ─── BULK PARENT TOPICS ─────────────────────────────────
+def _parent_row(topic: str, sorted_parents: list[str]) -> dict:
+    row = {'Topic': topic}
+    for i, p in enumerate(sorted_parents, start=1):
+        row[f'Parent {i}'] = p
+    return row
+
+# Pool workers call the persistent layer, not the st.cache_data entry points.
+_parents = telemetry.tagged(_parent_topics, stage="bulk_parents")
+_weights = telemetry.tagged(_parent_topic_weights, stage="bulk_weights")
+_fused = telemetry.tagged(_parents_fused, stage="bulk_fused")
+
+def iter_parent_weights(topics: list[str], max_workers: int = MAX_CONCURRENCY, fused: bool = False,
+                        skip_unavailable: bool = False):
+    # Pipelines find_parent_topics -> find_parent_topic_weights over a bounded pool
+    # and yields (index, row) as rows finish. A row's weighting call takes the slot
+    # its discovery call freed, so finished rows start arriving right away instead
+    # of after every topic's first stage. With fused=True each row is one
+    # find_parent_weights_fused call. With skip_unavailable, topics the API could
+    # not answer (breaker open, retries exhausted) yield (index, None) instead of
+    # an error row, for callers that will try them again.
+    queue = deque(enumerate(topics))
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while queue or pending:
+            while queue and len(pending) < max_workers:
+                i, topic = queue.popleft()
+                if fused:
+                    pending[telemetry.submit(pool, _fused, topic)] = (i, topic, "weights")
+                else:
+                    pending[telemetry.submit(pool, _parents, topic)] = (i, topic, "parents")
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i, topic, stage = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    if skip_unavailable and isinstance(e, UNAVAILABLE):
+                        yield i, None
+                    else:
+                        yield i, {**_parent_row(topic, []), 'Error': str(e)}
+                    continue
+                if stage == "parents" and result:
+                    pending[telemetry.submit(pool, _weights, topic, result)] = (i, topic, "weights")
+                else:
+                    yield i, _parent_row(topic, list(result['parent']) if stage == "weights" else [])
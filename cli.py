@@ -0,0 +1,186 @@
+"""Headless batch graph generation.
+
+Builds one knowledge graph per seed keyword without the Streamlit UI. Seeds
+are built concurrently and share the persistent completion cache, the
+single-flight layer and the process-wide rate limiter, so overlapping seeds
+reuse each other's completions. Graphs are written one file per seed (csv,
+json, graphml) or as one JSON line per seed (jsonl).
+
+    python cli.py seeds.txt --out graphs --format graphml --seed-workers 8
+    python cli.py seeds.txt --format jsonl --out graphs.jsonl --sub-depth 2
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import networkx as nx
+import pandas as pd
+
+from headless import quiet_streamlit
+
+quiet_streamlit()
+
+import llm  # noqa: E402
+import persistent_cache  # noqa: E402
+import telemetry  # noqa: E402
+from breaker import get_breaker  # noqa: E402
+from graph import MAX_CONCURRENCY, NODE_BUDGET, REQUEST_BUDGET, SCORERS, build_graph, graph_rows  # noqa: E402
+from hedging import Hedger, get_hedger, set_hedger  # noqa: E402
+from scheduler import get_scheduler  # noqa: E402
+from singleflight import flights  # noqa: E402
+
+FORMATS = ("csv", "json", "graphml", "jsonl")
+
+
+def read_seeds(path: str) -> list[str]:
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with f:
+        seeds = [line.strip() for line in f]
+    return list(dict.fromkeys(s for s in seeds if s and not s.startswith("#")))
+
+
+def seed_filename(seed: str, fmt: str) -> str:
+    # Readable and collision-free: a slug plus a short hash of the exact seed.
+    slug = re.sub(r"[^\w-]+", "_", seed).strip("_")[:60] or "seed"
+    return f"{slug}-{hashlib.sha1(seed.encode()).hexdigest()[:8]}.{fmt}"
+
+
+def graph_record(seed: str, G: nx.Graph) -> dict:
+    return {"seed": seed,
+            "nodes": [{"topic": d['label'], "type": d['rel'], "depth": d['depth'],
+                       **({"missing": d['missing'].split(",")} if d.get('missing') else {})}
+                      for _, d in G.nodes(data=True)],
+            "edges": [[u, v] for u, v in G.edges()]}
+
+
+def write_graph(G: nx.Graph, path: str, fmt: str) -> None:
+    tmp = f"{path}.tmp"
+    if fmt == "csv":
+        df = pd.DataFrame(graph_rows(G))
+        df.to_csv(tmp, index=False)
+    elif fmt == "json":
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(nx.node_link_data(G), f)
+    elif fmt == "graphml":
+        nx.write_graphml(G, tmp)
+    os.replace(tmp, path)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("seeds", help="file with one seed keyword per line ('-' for stdin)")
+    parser.add_argument("--out", default="graphs", help="output directory, or the output file for jsonl")
+    parser.add_argument("--format", choices=FORMATS, default="json")
+    parser.add_argument("--skip-existing", action="store_true", help="skip seeds whose output file already exists")
+    parser.add_argument("--seed-workers", type=int, default=4, help="graphs built at once")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENCY, help="concurrent requests per graph")
+    parser.add_argument("--batch-size", type=int, default=llm.BATCH_SIZE)
+    parser.add_argument("--sub-depth", type=int, default=1)
+    parser.add_argument("--max-sub", type=int, default=20)
+    parser.add_argument("--max-rel", type=int, default=20)
+    parser.add_argument("--sem-sub-lim", type=int, help="2nd level related (default: max-rel / 2)")
+    parser.add_argument("--max-q", type=int, default=20)
+    parser.add_argument("--no-questions", action="store_true")
+    parser.add_argument("--node-budget", type=int, default=NODE_BUDGET)
+    parser.add_argument("--request-budget", type=int, default=REQUEST_BUDGET)
+    parser.add_argument("--scorer", choices=list(SCORERS), default="depth_decay")
+    parser.add_argument("--hedge-percentile", type=float,
+                        help="duplicate calls slower than this latency percentile, e.g. 0.95 (default: KG_HEDGE_PERCENTILE)")
+    args = parser.parse_args(argv)
+    if args.hedge_percentile is not None:
+        set_hedger(Hedger(args.hedge_percentile, get_hedger().min_samples))
+
+    seeds = read_seeds(args.seeds)
+    sem_sub_lim = args.max_rel // 2 if args.sem_sub_lim is None else args.sem_sub_lim
+    if args.format == "jsonl":
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        done = set()
+        if args.skip_existing and os.path.exists(args.out):
+            with open(args.out, encoding="utf-8") as f:
+                done = {json.loads(line)["seed"] for line in f if line.strip()}
+        sink = open(args.out, "a", encoding="utf-8")
+    else:
+        os.makedirs(args.out, exist_ok=True)
+        done = {s for s in seeds if args.skip_existing
+                and os.path.exists(os.path.join(args.out, seed_filename(s, args.format)))}
+        sink = None
+    todo = [s for s in seeds if s not in done]
+    print(f"{len(seeds)} seeds, {len(done)} already written, building {len(todo)}", file=sys.stderr)
+
+    write_lock = threading.Lock()
+
+    def run(seed: str) -> tuple[int, int, int]:
+        G = build_graph(seed, args.sub_depth, args.max_sub, args.max_rel, sem_sub_lim, not args.no_questions,
+                        args.max_q, args.workers, args.batch_size, args.node_budget, args.request_budget,
+                        args.scorer)
+        if sink is not None:
+            line = json.dumps(graph_record(seed, G))
+            with write_lock:
+                sink.write(line + "\n")
+                sink.flush()
+        else:
+            write_graph(G, os.path.join(args.out, seed_filename(seed, args.format)), args.format)
+        missing = sum(bool(d.get('missing')) for _, d in G.nodes(data=True))
+        return G.number_of_nodes(), G.number_of_edges(), missing
+
+    calls_before = llm.API_CALLS["count"]
+    cache = persistent_cache.get_backend()
+    started = time.perf_counter()
+    built = failed = nodes = edges = incomplete = 0
+    try:
+        with telemetry.run("cli") as usage, ThreadPoolExecutor(max_workers=max(1, args.seed_workers)) as pool:
+            futures = {telemetry.submit(pool, run, s): s for s in todo}
+            for fut in as_completed(futures):
+                seed = futures[fut]
+                try:
+                    n, m, missing = fut.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"FAILED {seed!r}: {e!r}", file=sys.stderr)
+                    continue
+                built += 1
+                nodes += n
+                edges += m
+                incomplete += bool(missing)
+                elapsed = time.perf_counter() - started
+                note = f", {missing} nodes with unfetched branches" if missing else ""
+                print(f"[{built + failed}/{len(todo)}] {seed!r}: {n} nodes, {m} edges{note} "
+                      f"({(built + failed) / elapsed:.2f} seeds/s)", file=sys.stderr)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    elapsed = time.perf_counter() - started
+    calls = llm.API_CALLS["count"] - calls_before
+    stats = {
+        "seeds": len(todo),
+        "built": built,
+        "failed": failed,
+        "nodes": nodes,
+        "edges": edges,
+        "incomplete": incomplete,  # graphs built partly from cache while the API was unavailable
+        "seconds": round(elapsed, 2),
+        "seeds_per_s": round((built + failed) / max(elapsed, 1e-9), 3),
+        "completions": calls,
+        "completions_per_seed": round(calls / max(built, 1), 2),
+        **{k: v for k, v in usage.totals().items() if k != "calls"},
+        "cost_per_seed_usd": round(usage.totals()["cost_usd"] / max(built, 1), 6),
+        "stages": usage.summary(),
+        "cache": cache.stats.as_dict(),
+        "coalesced": flights.snapshot(),
+        "rate_limiter": get_scheduler().snapshot(),
+        "hedging": get_hedger().snapshot(),
+        "breaker": get_breaker().snapshot(),
+    }
+    print(json.dumps(stats, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+// Minimal offline WebGL graph renderer for large knowledge graphs.
+//
+// Draws precomputed node positions as GL points and edges as GL lines, with
+// pan (drag), zoom (wheel / pinch) and hover tooltips. Labels are drawn on a 2D
+// overlay for the highest-degree nodes in view only. Input is the columnar
+// payload built by render.graph_payload: base64 little-endian typed arrays for
+// positions (float32 x,y), edges (uint32 pairs), groups (uint8 palette index)
+// and depths (uint8), plus plain label/palette arrays.
+(function () {
+  "use strict";
+
+  function decode(b64, Type) {
+    const bin = atob(b64);
+    const bytes = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    return new Type(bytes.buffer);
+  }
+
+  function hexToRgb(hex) {
+    const v = parseInt(hex.slice(1), 16);
+    return [((v >> 16) & 255) / 255, ((v >> 8) & 255) / 255, (v & 255) / 255];
+  }
+
+  const VERTEX = `
+    attribute vec2 a_pos;
+    attribute vec3 a_color;
+    uniform vec2 u_offset;
+    uniform float u_scale;
+    uniform vec2 u_viewport;
+    uniform float u_size;
+    varying vec3 v_color;
+    void main() {
+      vec2 p = (a_pos * u_scale + u_offset) / u_viewport * 2.0;
+      gl_Position = vec4(p.x, -p.y, 0.0, 1.0);
+      gl_PointSize = u_size;
+      v_color = a_color;
+    }`;
+  const POINT_FRAGMENT = `
+    precision mediump float;
+    varying vec3 v_color;
+    void main() {
+      vec2 d = gl_PointCoord - vec2(0.5);
+      if (dot(d, d) > 0.25) discard;
+      gl_FragColor = vec4(v_color, 1.0);
+    }`;
+  const LINE_FRAGMENT = `
+    precision mediump float;
+    varying vec3 v_color;
+    void main() { gl_FragColor = vec4(v_color, 0.35); }`;
+
+  function compile(gl, vsrc, fsrc) {
+    const prog = gl.createProgram();
+    for (const [type, src] of [[gl.VERTEX_SHADER, vsrc], [gl.FRAGMENT_SHADER, fsrc]]) {
+      const sh = gl.createShader(type);
+      gl.shaderSource(sh, src);
+      gl.compileShader(sh);
+      if (!gl.getShaderParameter(sh, gl.COMPILE_STATUS)) throw new Error(gl.getShaderInfoLog(sh));
+      gl.attachShader(prog, sh);
+    }
+    gl.linkProgram(prog);
+    return prog;
+  }
+
+  function buffer(gl, data) {
+    const buf = gl.createBuffer();
+    gl.bindBuffer(gl.ARRAY_BUFFER, buf);
+    gl.bufferData(gl.ARRAY_BUFFER, data, gl.STATIC_DRAW);
+    return buf;
+  }
+
+  window.renderGraphGL = function (container, payload) {
+    const n = payload.n;
+    const pos = decode(payload.positions, Float32Array);
+    const edges = payload.edges ? decode(payload.edges, Uint32Array) : new Uint32Array(0);
+    const groups = decode(payload.groups, Uint8Array);
+    const depths = decode(payload.depths, Uint8Array);
+    const palette = payload.palette.map(hexToRgb);
+    const labels = payload.labels;
+    const groupNames = payload.group_names;
+    const missing = payload.missing || {};  // node index -> relations not fetched
+
+    const canvas = document.createElement("canvas");
+    const overlay = document.createElement("canvas");
+    const tip = document.createElement("div");
+    container.style.position = "relative";
+    for (const el of [canvas, overlay]) {
+      el.style.position = "absolute";
+      el.style.left = el.style.top = "0";
+      el.style.width = "100%";
+      el.style.height = "100%";
+      container.appendChild(el);
+    }
+    overlay.style.pointerEvents = "none";
+    tip.style.cssText = "position:absolute;pointer-events:none;background:#fff;border:1px solid #ccc;" +
+      "padding:2px 6px;font:12px sans-serif;display:none;white-space:nowrap";
+    container.appendChild(tip);
+
+    const gl = canvas.getContext("webgl", { antialias: true });
+    if (!gl) {
+      container.textContent = "WebGL is not available in this browser.";
+      return;
+    }
+    const ctx = overlay.getContext("2d");
+
+    // Per-vertex buffers: nodes as points, edges as line endpoints.
+    const nodeColors = new Float32Array(n * 3);
+    for (let i = 0; i < n; i++) nodeColors.set(palette[groups[i]], i * 3);
+    const m = edges.length / 2;
+    const edgePos = new Float32Array(m * 4);
+    for (let e = 0; e < m; e++) {
+      const a = edges[2 * e], b = edges[2 * e + 1];
+      edgePos[4 * e] = pos[2 * a];
+      edgePos[4 * e + 1] = pos[2 * a + 1];
+      edgePos[4 * e + 2] = pos[2 * b];
+      edgePos[4 * e + 3] = pos[2 * b + 1];
+    }
+    const edgeColors = new Float32Array(m * 6).fill(0.6);
+
+    const pointProg = compile(gl, VERTEX, POINT_FRAGMENT);
+    const lineProg = compile(gl, VERTEX, LINE_FRAGMENT);
+    const bufs = {
+      nodePos: buffer(gl, pos), nodeColor: buffer(gl, nodeColors),
+      edgePos: buffer(gl, edgePos), edgeColor: buffer(gl, edgeColors),
+    };
+
+    // Label priority: degree, highest first.
+    const degree = new Uint32Array(n);
+    for (let i = 0; i < edges.length; i++) degree[edges[i]]++;
+    const byDegree = Array.from({ length: n }, (_, i) => i).sort((a, b) => degree[b] - degree[a]);
+
+    const view = { scale: 1, x: 0, y: 0 };
+    let width = 0, height = 0, dpr = window.devicePixelRatio || 1;
+
+    function fit() {
+      let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+      for (let i = 0; i < n; i++) {
+        minX = Math.min(minX, pos[2 * i]); maxX = Math.max(maxX, pos[2 * i]);
+        minY = Math.min(minY, pos[2 * i + 1]); maxY = Math.max(maxY, pos[2 * i + 1]);
+      }
+      const w = Math.max(maxX - minX, 1), h = Math.max(maxY - minY, 1);
+      view.scale = 0.9 * Math.min(width / w, height / h);
+      view.x = -(minX + w / 2) * view.scale;
+      view.y = -(minY + h / 2) * view.scale;
+    }
+
+    function resize() {
+      dpr = window.devicePixelRatio || 1;
+      width = container.clientWidth;
+      height = container.clientHeight;
+      for (const el of [canvas, overlay]) {
+        el.width = width * dpr;
+        el.height = height * dpr;
+      }
+    }
+
+    function draw(prog, posBuf, colorBuf, mode, count, size) {
+      gl.useProgram(prog);
+      for (const [name, buf, dim] of [["a_pos", posBuf, 2], ["a_color", colorBuf, 3]]) {
+        const loc = gl.getAttribLocation(prog, name);
+        gl.bindBuffer(gl.ARRAY_BUFFER, buf);
+        gl.enableVertexAttribArray(loc);
+        gl.vertexAttribPointer(loc, dim, gl.FLOAT, false, 0, 0);
+      }
+      gl.uniform2f(gl.getUniformLocation(prog, "u_offset"), view.x, view.y);
+      gl.uniform1f(gl.getUniformLocation(prog, "u_scale"), view.scale);
+      gl.uniform2f(gl.getUniformLocation(prog, "u_viewport"), width, height);
+      gl.uniform1f(gl.getUniformLocation(prog, "u_size"), size * dpr);
+      gl.drawArrays(mode, 0, count);
+    }
+
+    function toScreen(i) {
+      return [pos[2 * i] * view.scale + view.x + width / 2, pos[2 * i + 1] * view.scale + view.y + height / 2];
+    }
+
+    let pending = false;
+    function render() {
+      pending = false;
+      gl.viewport(0, 0, canvas.width, canvas.height);
+      gl.clearColor(1, 1, 1, 1);
+      gl.clear(gl.COLOR_BUFFER_BIT);
+      gl.enable(gl.BLEND);
+      gl.blendFunc(gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA);
+      const size = Math.max(2, Math.min(12, 3 * Math.sqrt(view.scale * 10)));
+      draw(lineProg, bufs.edgePos, bufs.edgeColor, gl.LINES, m * 2, 1);
+      draw(pointProg, bufs.nodePos, bufs.nodeColor, gl.POINTS, n, size);
+
+      ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+      ctx.clearRect(0, 0, width, height);
+      ctx.font = "11px sans-serif";
+      ctx.fillStyle = "#222";
+      // Nodes with unfetched branches get a dashed ring.
+      ctx.strokeStyle = payload.missing_color;
+      ctx.setLineDash([3, 2]);
+      for (const key in missing) {
+        const [sx, sy] = toScreen(+key);
+        if (sx < 0 || sy < 0 || sx > width || sy > height) continue;
+        ctx.beginPath();
+        ctx.arc(sx, sy, size / 2 + 3, 0, 2 * Math.PI);
+        ctx.stroke();
+      }
+      ctx.setLineDash([]);
+      let drawn = 0;
+      for (const i of byDegree) {
+        if (drawn >= 250) break;
+        const [sx, sy] = toScreen(i);
+        if (sx < 0 || sy < 0 || sx > width || sy > height) continue;
+        ctx.fillText(labels[i], sx + size / 2 + 2, sy + 4);
+        drawn++;
+      }
+    }
+    function schedule() {
+      if (!pending) {
+        pending = true;
+        requestAnimationFrame(render);
+      }
+    }
+
+    function nearest(mx, my) {
+      const wx = (mx - width / 2 - view.x) / view.scale, wy = (my - height / 2 - view.y) / view.scale;
+      let best = -1, bestD = Infinity;
+      for (let i = 0; i < n; i++) {
+        const dx = pos[2 * i] - wx, dy = pos[2 * i + 1] - wy, d = dx * dx + dy * dy;
+        if (d < bestD) { bestD = d; best = i; }
+      }
+      return Math.sqrt(bestD) * view.scale < 8 ? best : -1;
+    }
+
+    let drag = null;
+    canvas.addEventListener("mousedown", e => { drag = { x: e.clientX, y: e.clientY }; });
+    window.addEventListener("mouseup", () => { drag = null; });
+    canvas.addEventListener("mousemove", e => {
+      if (drag) {
+        view.x += e.clientX - drag.x;
+        view.y += e.clientY - drag.y;
+        drag = { x: e.clientX, y: e.clientY };
+        tip.style.display = "none";
+        schedule();
+        return;
+      }
+      const rect = canvas.getBoundingClientRect();
+      const i = nearest(e.clientX - rect.left, e.clientY - rect.top);
+      if (i < 0) {
+        tip.style.display = "none";
+        return;
+      }
+      tip.textContent = `${labels[i]} — ${groupNames[groups[i]]} (depth ${depths[i]})` +
+        (missing[i] ? ` — not fetched: ${missing[i].replace(/,/g, ", ")}` : "");
+      tip.style.left = (e.clientX - rect.left + 12) + "px";
+      tip.style.top = (e.clientY - rect.top + 12) + "px";
+      tip.style.display = "block";
+    });
+    canvas.addEventListener("wheel", e => {
+      e.preventDefault();
+      const rect = canvas.getBoundingClientRect();
+      const mx = e.clientX - rect.left - width / 2, my = e.clientY - rect.top - height / 2;
+      const k = Math.exp(-e.deltaY * 0.0015);
+      view.x = mx - (mx - view.x) * k;
+      view.y = my - (my - view.y) * k;
+      view.scale *= k;
+      schedule();
+    }, { passive: false });
+
+    let pinch = null;
+    canvas.addEventListener("touchstart", e => {
+      if (e.touches.length === 1) drag = { x: e.touches[0].clientX, y: e.touches[0].clientY };
+      if (e.touches.length === 2) {
+        pinch = Math.hypot(e.touches[0].clientX - e.touches[1].clientX, e.touches[0].clientY - e.touches[1].clientY);
+      }
+    });
+    canvas.addEventListener("touchmove", e => {
+      e.preventDefault();
+      if (e.touches.length === 1 && drag) {
+        view.x += e.touches[0].clientX - drag.x;
+        view.y += e.touches[0].clientY - drag.y;
+        drag = { x: e.touches[0].clientX, y: e.touches[0].clientY };
+      } else if (e.touches.length === 2 && pinch) {
+        const d = Math.hypot(e.touches[0].clientX - e.touches[1].clientX, e.touches[0].clientY - e.touches[1].clientY);
+        view.x *= d / pinch;
+        view.y *= d / pinch;
+        view.scale *= d / pinch;
+        pinch = d;
+      }
+      schedule();
+    }, { passive: false });
+    canvas.addEventListener("touchend", () => { drag = null; pinch = null; });
+    canvas.addEventListener("dblclick", () => { fit(); schedule(); });
+
+    window.addEventListener("resize", () => { resize(); schedule(); });
+    resize();
+    fit();
+    schedule();
+  };
+})();
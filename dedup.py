@@ -0,0 +1,104 @@
+import functools
+
+import numpy as np
+
+# Embedding-based canonicalization of graph terms. New terms are encoded in one
+# batch and compared with every known node by cosine similarity; anything at or
+# above the threshold resolves to the existing node instead of creating a new
+# one, so "ETL process" and "Extract, Transform, Load" are never expanded twice.
+# Requires the optional sentence-transformers extra (requirements-embeddings.txt)
+# unless an encoder is passed in.
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_THRESHOLD = 0.85
+
+
+def available() -> bool:
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _load_model(name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name, device="cpu")
+
+
+def sentence_encoder(name: str = DEFAULT_MODEL):
+    def encode(texts: list[str]) -> np.ndarray:
+        return _load_model(name).encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+    return encode
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.where(norms == 0, 1, norms)
+
+
+class SemanticIndex:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, encoder=None):
+        self.threshold = threshold
+        self.encoder = encoder or sentence_encoder()
+        self.terms: list[str] = []
+        self.by_key: dict[str, str] = {}  # casefolded term -> canonical term
+        self.aliases: dict[str, list[str]] = {}  # canonical term -> merged variants
+        self._buf = np.zeros((0, 0), dtype=np.float32)  # grows by doubling; rows [:len(terms)] are live
+
+    @property
+    def merged(self) -> int:
+        return sum(len(v) for v in self.aliases.values())
+
+    def resolve(self, terms: list[str]) -> list[str]:
+        """Map each term to its canonical form, registering the ones that are new."""
+        out: list[str | None] = []
+        pending = {}  # casefolded key -> position of first occurrence in out
+        for t in terms:
+            key = t.strip().casefold()
+            if key in self.by_key:
+                out.append(self.by_key[key])
+            else:
+                pending.setdefault(key, len(out))
+                out.append(None)
+        if pending:
+            firsts = [terms[i] for i in pending.values()]
+            vecs = _normalize(self.encoder(firsts))
+            n = len(self.terms)
+            # Every new term against every known node in one product, and against
+            # each other in a second; only matches within the batch depend on order.
+            known = vecs @ self._buf[:n].T if n else np.zeros((len(vecs), 0), dtype=np.float32)
+            within = vecs @ vecs.T
+            added: list[int] = []  # batch positions registered as new nodes, in order
+            for i, (key, term) in enumerate(zip(pending, firsts)):
+                canon = self._nearest(known[i], within[i, added])
+                if canon is None:
+                    canon = term
+                    self._append(vecs[i])
+                    self.terms.append(term)
+                    added.append(i)
+                else:
+                    self.aliases.setdefault(canon, []).append(term)
+                self.by_key[key] = canon
+            out = [o if o is not None else self.by_key[t.strip().casefold()] for o, t in zip(out, terms)]
+        return out
+
+    def _append(self, vec: np.ndarray) -> None:
+        n = len(self.terms)
+        if n == len(self._buf):
+            grown = np.zeros((max(64, 2 * n), vec.shape[0]), dtype=np.float32)
+            if n:
+                grown[:n] = self._buf[:n]
+            self._buf = grown
+        self._buf[n] = vec
+
+    def _nearest(self, known: np.ndarray, batch: np.ndarray) -> str | None:
+        # Similarities to the nodes indexed before this batch, then to the ones the
+        # batch has added since; together they line up with self.terms.
+        sims = np.concatenate([known, batch])
+        if not len(sims):
+            return None
+        best = int(np.argmax(sims))
+        return self.terms[best] if sims[best] >= self.threshold else None
@@ -0,0 +1,133 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import telemetry
+from llm import LLMBackend, LLMRequest
+from scheduler import RateLimited, TransientError
+
+# Offline stand-in for the OpenAI backend. Answers are derived from a seed and
+# the request's structured params, so the same question always gets the same
+# answer (single-term and batched neighbor calls agree). Latency is lognormal
+# around a median, and errors, 429s and malformed answers are injected at fixed
+# rates.
+
+_VOCAB = [
+    "architecture", "modeling", "pipeline", "governance", "quality", "security", "storage", "analytics",
+    "metadata", "lineage", "ingestion", "orchestration", "indexing", "partitioning", "caching", "scaling",
+    "monitoring", "testing", "migration", "compliance", "optimization", "visualization", "integration",
+    "automation", "streaming", "batching", "schema", "catalog", "warehouse", "lakehouse", "reporting",
+]
+_DOMAINS = ["data engineering", "software engineering", "business intelligence", "cloud computing",
+            "machine learning", "information management", "databases", "analytics"]
+
+
+class FakeLLMError(TransientError):
+    pass
+
+
+class FakeLLMBackend(LLMBackend):
+    def __init__(self, seed: int = 0, latency: float = 0.0, latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, malformed_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float | None = None):
+        self.seed = seed
+        self.latency = latency  # median seconds per completion
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.model = f"fake-llm-{seed}"
+        self.calls = 0
+        self.calls_by_task: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMBackend":
+        env = os.environ.get
+        return cls(
+            seed=int(env("KG_FAKE_SEED", 0)),
+            latency=float(env("KG_FAKE_LATENCY", 0.2)),
+            latency_sigma=float(env("KG_FAKE_LATENCY_SIGMA", 0.5)),
+            error_rate=float(env("KG_FAKE_ERROR_RATE", 0)),
+            malformed_rate=float(env("KG_FAKE_MALFORMED_RATE", 0)),
+            rate_limit_rate=float(env("KG_FAKE_RATE_LIMIT_RATE", 0)),
+        )
+
+    def _rng(self, *parts) -> random.Random:
+        return random.Random(json.dumps([self.seed, *parts], sort_keys=True, default=str))
+
+    def _neighbors(self, term: str, rel: str, limit: int) -> list[str]:
+        rng = self._rng("neighbors", term, rel)
+        n = rng.randint(max(1, math.ceil(limit * 0.7)), max(1, limit))
+        words = rng.sample(_VOCAB, min(len(_VOCAB), n * 2))
+        if rel == "related_question":
+            return [f"what is {w} in {term}?" for w in words][:n]
+        # Half the answers reuse shared vocabulary pairs so graphs have cross-links.
+        out = []
+        for i, w in enumerate(words):
+            out.append(f"{term} {w}" if i % 2 == 0 else f"{w} {words[-1 - i]}")
+        return list(dict.fromkeys(out))[:n]
+
+    def _parents(self, topic: str, limit: int) -> list[str]:
+        return self._rng("parents", topic).sample(_DOMAINS, min(limit, len(_DOMAINS)))
+
+    def _scores(self, topic: str, parents: list[str]) -> list[dict]:
+        return [{"parent": p, "score": self._rng("score", topic, p).randint(0, 100)} for p in parents]
+
+    def answer(self, req: LLMRequest):
+        # Shaped like the prompts ask: lists wrapped in {"items": [...]}.
+        p = req.params
+        if req.task == "neighbors":
+            return {"items": self._neighbors(p["term"], p["rel"], p["limit"])}
+        if req.task == "neighbors_batch":
+            return {t: self._neighbors(t, p["rel"], p["limit"]) for t in p["terms"]}
+        if req.task == "parents":
+            return {"items": self._parents(p["topic"], p["limit"])}
+        if req.task == "parent_weights":
+            return {"items": self._scores(p["topic"], p["candidates"])}
+        if req.task == "parents_fused":
+            return {"items": self._scores(p["topic"], self._parents(p["topic"], p["limit"]))}
+        raise ValueError(f"FakeLLMBackend cannot answer task {req.task!r}")
+
+    def _start(self, req: LLMRequest) -> tuple[random.Random, float]:
+        with self._lock:
+            self.calls += 1
+            self.calls_by_task[req.task] = self.calls_by_task.get(req.task, 0) + 1
+            # Per-call randomness (latency, faults) varies between repeats of a
+            # request but is reproducible for a given seed and call sequence.
+            rng = self._rng("call", self.calls)
+        delay = rng.lognormvariate(math.log(self.latency), self.latency_sigma) if self.latency > 0 else 0.0
+        return rng, delay
+
+    def _content(self, req: LLMRequest, rng: random.Random) -> str:
+        if rng.random() < self.rate_limit_rate:
+            raise RateLimited(f"injected 429 for {req.task}", self.retry_after)
+        if rng.random() < self.error_rate:
+            raise FakeLLMError(f"injected failure for {req.task}")
+        if rng.random() < self.malformed_rate:
+            content = "Sure! Here are some ideas:\n- " + req.task
+        else:
+            content = json.dumps(self.answer(req))
+        # Token usage estimated at ~4 characters per token.
+        telemetry.usage((len(req.system) + len(req.prompt)) // 4 + 8, len(content) // 4 + 1)
+        return content
+
+    def complete(self, req: LLMRequest) -> str:
+        rng, delay = self._start(req)
+        time.sleep(delay)
+        return self._content(req, rng)
+
+    def stream(self, req: LLMRequest):
+        # A tenth of the latency passes before the first chunk; the rest is
+        # spread evenly over ~2-token chunks, like a model generating.
+        rng, delay = self._start(req)
+        time.sleep(delay * 0.1)
+        content = self._content(req, rng)
+        chunks = [content[i:i + 8] for i in range(0, len(content), 8)]
+        for chunk in chunks:
+            time.sleep(delay * 0.9 / len(chunks))
+            yield chunk
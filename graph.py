@@ -0,0 +1,298 @@
+import heapq
+import itertools
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+import networkx as nx
+
+import telemetry
+from llm import BATCH_SIZE, UNAVAILABLE, ParseError, _llm_neighbors, get_llm_neighbors_batch, stream_llm_neighbors
+
+MAX_CONCURRENCY = 8  # default cap on in-flight completions per frontier
+NODE_BUDGET = 400  # default cap on graph size once subtopic expansion goes past depth 1
+REQUEST_BUDGET = 150  # default cap on subtopic-expansion completions
+
+# ─── GRAPH BUILDER ──────────────────────────────────────
+def _submit_frontier(pool, requests: list[tuple[str, str, int]], batch_size: int = BATCH_SIZE,
+                     stage: str = "frontier") -> dict:
+    # Submit one frontier's (term, rel, limit) requests to pool; duplicates and
+    # zero-limit requests never reach the API. Terms sharing a (rel, limit) are
+    # grouped into batched completions of up to batch_size terms. Returns a map
+    # from request to the future of the chunk that answers it. Calls are tagged
+    # with stage and relation for telemetry. A request the API could not answer
+    # (breaker open, retries exhausted) maps to None instead of a list.
+    unique = list(dict.fromkeys(r for r in requests if r[2] > 0))
+    groups: dict[tuple[str, int], list[str]] = {}
+    for term, rel, limit in unique:
+        groups.setdefault((rel, limit), []).append(term)
+
+    def run(terms, rel, limit):
+        if len(terms) == 1:
+            try:
+                return {(terms[0], rel, limit): _llm_neighbors(terms[0], rel, limit)}
+            except ParseError:
+                return {}  # no usable answer after retries; the branch stays empty this run
+            except UNAVAILABLE:
+                return {(terms[0], rel, limit): None}
+        try:
+            answers = get_llm_neighbors_batch(terms, rel, limit)
+        except ParseError:
+            return {}
+        return {(t, rel, limit): answers.get(t) for t in terms}
+
+    futures = {}
+    step = max(1, batch_size)
+    for (rel, limit), terms in groups.items():
+        for i in range(0, len(terms), step):
+            chunk = terms[i:i+step]
+            fut = telemetry.submit(pool, telemetry.tagged(run, stage=stage, rel=rel), chunk, rel, limit)
+            futures.update({(t, rel, limit): fut for t in chunk})
+    return futures
+
+def _answer(futures: dict, request: tuple[str, str, int]) -> list[str] | None:
+    fut = futures.get(request)
+    return fut.result().get(request, []) if fut else []
+
+def _result(rec, futures: dict, request: tuple[str, str, int]) -> list[str]:
+    # The answer to request; when the API could not give one, its term is marked.
+    items = _answer(futures, request)
+    if items is None:
+        _mark_missing(rec, request[0], request[1])
+        return []
+    return items
+
+def _mark_missing(rec, node, rel: str) -> None:
+    # Nodes carry the relations that could not be fetched as "missing", e.g.
+    # "subtopic,related", so views and exports can flag incomplete branches.
+    missing = [m for m in rec.G.nodes[node].get('missing', "").split(",") if m]
+    if rel not in missing:
+        rec.node(node, missing=",".join([*missing, rel]))
+
+def fetch_frontier(requests: list[tuple[str, str, int]], max_workers: int = MAX_CONCURRENCY,
+                   batch_size: int = BATCH_SIZE, stage: str = "frontier") -> dict[tuple[str, str, int], list[str] | None]:
+    # None for requests the API could not answer.
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = _submit_frontier(pool, requests, batch_size, stage)
+        return {r: _answer(futures, r) for r in futures}
+
+class _DeltaRecorder:
+    # Applies node/edge additions to G and remembers them until the next flush.
+    def __init__(self, G: nx.Graph):
+        self.G = G
+        self.nodes = {}
+        self.edges = []
+
+    def node(self, n, **attrs):
+        self.G.add_node(n, **attrs)
+        self.nodes[n] = self.G.nodes[n]
+
+    def edge(self, u, v):
+        self.G.add_edge(u, v)
+        self.edges.append((u, v))
+
+    def flush(self) -> dict:
+        delta = {"nodes": [(n, dict(a)) for n, a in self.nodes.items()], "edges": self.edges}
+        self.nodes, self.edges = {}, []
+        return delta
+
+# ─── SUBTOPIC EXPANSION ─────────────────────────────────
+# Scorers rank frontier nodes for best-first expansion; higher expands sooner.
+def score_depth_decay(G: nx.Graph, node, parent, decay: float = 0.6) -> float:
+    return decay ** G.nodes[node]['depth']
+
+def score_fanout(G: nx.Graph, node, parent) -> float:
+    # Children of wide parents score lower, spreading the budget across branches.
+    return score_depth_decay(G, node, parent) / math.sqrt(max(1, G.degree(parent)))
+
+SCORERS = {"depth_decay": score_depth_decay, "fanout": score_fanout}
+
+def _sub_limit(max_sub: int, depth: int) -> int:
+    # Subtopics requested when expanding a node at `depth`: halves per level.
+    return max(1, max_sub >> depth)
+
+def _same(parent, terms):
+    return terms
+
+def _expand_subtopics(G, rec, pool, roots, max_depth, max_sub, batch_size, wave_size,
+                      scorer=score_depth_decay, node_budget=None, request_budget=None, canon=_same):
+    # Best-first subtopic expansion below `roots`. The highest-scoring frontier
+    # nodes are expanded wave_size at a time until the frontier is exhausted or
+    # the node or request budget is spent. Nodes already in G are linked but never
+    # expanded again.
+    heap, seq = [], itertools.count()
+    for n in roots:
+        if G.nodes[n]['depth'] < max_depth:
+            heapq.heappush(heap, (-scorer(G, n, next(iter(G[n]), None)), next(seq), n))
+    requests = 0
+    full = lambda: node_budget is not None and G.number_of_nodes() >= node_budget
+    while heap and not full() and (request_budget is None or requests < request_budget):
+        size = wave_size if request_budget is None else min(wave_size, (request_budget - requests) * batch_size)
+        wave = [heapq.heappop(heap)[2] for _ in range(min(size, len(heap)))]
+        reqs = [(n, "subtopic", _sub_limit(max_sub, G.nodes[n]['depth'])) for n in wave]
+        futures = _submit_frontier(pool, reqs, batch_size, "subtopic_deep")
+        requests += len({id(f) for f in futures.values()})
+        for req in reqs:
+            node, depth = req[0], G.nodes[req[0]]['depth'] + 1
+            added = []
+            for sub in canon(node, _result(rec, futures, req)):
+                if not G.has_node(sub):
+                    if full():
+                        break
+                    rec.node(sub, label=sub, rel="subtopic", depth=depth)
+                    added.append(sub)
+                rec.edge(node, sub)
+            if depth < max_depth:
+                for sub in added:
+                    heapq.heappush(heap, (-scorer(G, sub, node), next(seq), sub))
+            yield rec.flush()
+
+# ─── STREAMED SEED RING ─────────────────────────────────
+def _stream_ring(pool, rec, seed, ring, canon, batch_size, sem_sub_lim, futures):
+    # The seed's neighbors are added one by one as the completions stream in,
+    # and second-level related requests go out in batches while the ring is
+    # still generating. Returns the related terms in arrival order.
+    events = queue.Queue()
+
+    def run(term, rel, limit):
+        error = None
+        try:
+            stream_llm_neighbors(term, rel, limit, lambda item: events.put((rel, item)))
+        except ParseError:
+            pass
+        except Exception as e:
+            error = e
+        events.put((rel, error))  # end of this stream
+
+    for term, rel, limit in ring:
+        if limit > 0:
+            telemetry.submit(pool, telemetry.tagged(run, stage="seed", rel=rel), term, rel, limit)
+    open_streams = sum(1 for r in ring if r[2] > 0)
+    rels, pending, seen = [], [], set()
+    while open_streams:
+        rel, item = events.get()
+        if not isinstance(item, str):
+            if isinstance(item, UNAVAILABLE):
+                _mark_missing(rec, seed, rel)
+            elif item is not None:
+                raise item
+            open_streams -= 1
+            if rel == "related" and pending:
+                futures.update(_submit_frontier(pool, pending, batch_size, "related_2nd"))
+                pending = []
+            continue
+        for t in canon(seed, [item]):
+            if (rel, t) in seen:
+                continue
+            seen.add((rel, t))
+            rec.node(t, label=t, rel=rel, depth=1)
+            rec.edge(seed, t)
+            if rel == "related":
+                rels.append(t)
+                pending.append((t, "related", sem_sub_lim))
+                if len(pending) >= max(1, batch_size):
+                    futures.update(_submit_frontier(pool, pending, batch_size, "related_2nd"))
+                    pending = []
+        yield rec.flush()
+    return rels
+
+def iter_build_graph(G, seed, sub_depth, max_sub, max_rel, sem_sub_lim, include_q, max_q,
+                     max_workers=MAX_CONCURRENCY, batch_size=BATCH_SIZE,
+                     node_budget=None, request_budget=None, scorer="depth_decay", dedup=None, stream=False):
+    # Grows G in place and yields a {"nodes": [(id, attrs)], "edges": [(u, v)]}
+    # delta after each expansion step. Every frontier is in flight at once; results
+    # are applied in a fixed order so the final graph does not depend on timing.
+    # Subtopics below depth 1 are expanded best-first within node_budget and
+    # request_budget, ranked by one of SCORERS (or any callable with that shape).
+    # With a dedup.SemanticIndex, incoming terms resolve to their canonical node
+    # before they are added, so near-duplicates are linked instead of expanded.
+    # With stream=True the seed ring is streamed (see _stream_ring): the first
+    # nodes appear while the ring is still generating, at the cost of the final
+    # graph depending on arrival order where the ring's lists overlap.
+    scorer = SCORERS[scorer] if isinstance(scorer, str) else scorer
+    canon = _same
+    if dedup is not None:
+        dedup.resolve([seed])
+        canon = lambda parent, terms: [t for t in dict.fromkeys(dedup.resolve(terms)) if t != parent]
+    rec = _DeltaRecorder(G)
+    rec.node(seed, label=seed, rel="seed", depth=0)
+    yield rec.flush()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        ring = [(seed, "subtopic", max_sub), (seed, "related", max_rel)]
+        if include_q:
+            ring.append((seed, "related_question", max_q))
+        if stream:
+            futures = {}
+            rels = yield from _stream_ring(pool, rec, seed, ring, canon, batch_size, sem_sub_lim, futures)
+        else:
+            futures = _submit_frontier(pool, ring, batch_size, "seed")
+            for t in canon(seed, _result(rec, futures, ring[0])):
+                rec.node(t, label=t, rel="subtopic", depth=1)
+                rec.edge(seed, t)
+            yield rec.flush()
+            # Second-level related terms go out before the (possibly long) subtopic expansion.
+            rels = canon(seed, _result(rec, futures, ring[1]))
+            futures.update(_submit_frontier(pool, [(r, "related", sem_sub_lim) for r in rels], batch_size,
+                                            "related_2nd"))
+            for rel in rels:
+                rec.node(rel, label=rel, rel="related", depth=1)
+                rec.edge(seed, rel)
+            yield rec.flush()
+            if include_q:
+                for q in canon(seed, _result(rec, futures, ring[2])):
+                    rec.node(q, label=q, rel="related_question", depth=1)
+                    rec.edge(seed, q)
+                yield rec.flush()
+        # The whole seed ring is in G before the expansion, in both modes, so
+        # node_budget counts the same nodes either way.
+        if sub_depth > 1:
+            roots = [n for n in G.nodes if G.nodes[n]['rel'] == 'subtopic']
+            yield from _expand_subtopics(G, rec, pool, roots, sub_depth, max_sub, batch_size,
+                                         max(1, max_workers) * max(1, batch_size), scorer,
+                                         node_budget, request_budget, canon)
+        for rel in rels:
+            for subr in canon(rel, _result(rec, futures, (rel, "related", sem_sub_lim))):
+                if not G.has_node(subr):
+                    rec.node(subr, label=subr, rel="related", depth=2)
+                rec.edge(rel, subr)
+            yield rec.flush()
+
+# ─── INTERACTIVE EXPANSION ──────────────────────────────
+def expand_node(G: nx.Graph, node, max_sub: int, max_rel: int, dedup=None) -> dict:
+    # Grow G around one node (e.g. a clicked one): its subtopics and related terms
+    # one level deeper. Returns only what was added, in the iter_build_graph delta
+    # format. Answers come from the same persistent cache entries, so
+    # re-expanding a node costs nothing.
+    canon = _same
+    if dedup is not None:
+        canon = lambda parent, terms: [t for t in dict.fromkeys(dedup.resolve(terms)) if t != parent]
+    rec = _DeltaRecorder(G)
+    depth = G.nodes[node]['depth'] + 1
+    results = fetch_frontier([(node, "subtopic", max_sub), (node, "related", max_rel)], max_workers=2,
+                             stage="explore")
+    for rel, limit in (("subtopic", max_sub), ("related", max_rel)):
+        items = results.get((node, rel, limit), [])
+        if items is None:
+            _mark_missing(rec, node, rel)
+            continue
+        if rel in G.nodes[node].get('missing', "").split(","):
+            rec.node(node, missing=",".join(m for m in G.nodes[node]['missing'].split(",") if m != rel))
+        for t in canon(node, items):
+            if not G.has_node(t):
+                rec.node(t, label=t, rel=rel, depth=depth)
+            if not G.has_edge(node, t):
+                rec.edge(node, t)
+    return rec.flush()
+
+def graph_rows(G: nx.Graph) -> list[dict]:
+    # One row per node, as in the CSV exports.
+    return [{'Topic': d['label'], 'Type': d['rel'], 'Depth': d['depth']} for _, d in G.nodes(data=True)]
+
+def build_graph(seed, sub_depth, max_sub, max_rel, sem_sub_lim, include_q, max_q, max_workers=MAX_CONCURRENCY,
+                batch_size=BATCH_SIZE, node_budget=None, request_budget=None, scorer="depth_decay", dedup=None,
+                stream=False):
+    G = nx.Graph()
+    for _ in iter_build_graph(G, seed, sub_depth, max_sub, max_rel, sem_sub_lim, include_q, max_q,
+                              max_workers, batch_size, node_budget, request_budget, scorer, dedup, stream):
+        pass
+    return G
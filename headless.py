@@ -0,0 +1,12 @@
+import logging
+
+# Running the pipeline without the Streamlit UI (cli.py, benchmarks). Call
+# quiet_streamlit() before importing llm or graph: their cached functions are
+# created at import time and, in bare mode, warn about the missing runtime.
+
+
+def quiet_streamlit() -> None:
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    config.get_config_options()  # parse now: parsing resets the log level to logger.level
+    set_log_level(logging.ERROR)  # also the level for streamlit loggers created later
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from dataclasses import dataclass, asdict
+
+import telemetry
+
+# Hedged requests against tail latency. Successful call latencies are kept per
+# key (task and relation) over a sliding window; once a call has run longer than
+# the configured percentile of its key, a duplicate is sent and whichever
+# answers first wins. A duplicate still queued when the first answer arrives is
+# cancelled; one already on the wire cannot be recalled, so its answer is
+# dropped (its tokens are still billed and show up in telemetry as a hedge
+# record). Configure with KG_HEDGE_PERCENTILE (e.g. 0.95; 0 disables, the
+# default) and KG_HEDGE_MIN_SAMPLES.
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self.size = size
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, key: str, q: float, min_samples: int = 1) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+    cancelled: int = 0  # duplicates withdrawn before they were sent
+
+
+class Hedger:
+    def __init__(self, percentile: float = 0.0, min_samples: int = 20, window: int = 200, max_workers: int = 64):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = LatencyWindow(window)
+        self.stats = HedgeStats()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Hedger":
+        env = os.environ.get
+        return cls(percentile=float(env("KG_HEDGE_PERCENTILE", 0)), min_samples=int(env("KG_HEDGE_MIN_SAMPLES", 20)))
+
+    @property
+    def enabled(self) -> bool:
+        return 0 < self.percentile < 1
+
+    def threshold(self, key: str) -> float | None:
+        return self.latencies.percentile(key, self.percentile, self.min_samples) if self.enabled else None
+
+    def call(self, key: str, fn, duplicate):
+        """Return (fn(), False) or, when fn passes the key's latency threshold, the
+        first answer from fn() and duplicate() with whether the duplicate won."""
+        with self._lock:
+            self.stats.calls += 1
+        started = time.perf_counter()
+        delay = self.threshold(key)
+        if delay is None:
+            result = fn()
+            self.latencies.add(key, time.perf_counter() - started)
+            return result, False
+        first = telemetry.submit(self._pool, fn)
+        try:
+            result = first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        else:
+            self.latencies.add(key, time.perf_counter() - started)
+            return result, False
+        second = telemetry.submit(self._pool, duplicate)
+        with self._lock:
+            self.stats.hedged += 1
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    won = fut is second
+                    cancelled = sum(f.cancel() for f in pending)
+                    with self._lock:
+                        self.stats.hedge_wins += won
+                        self.stats.cancelled += cancelled
+                    self.latencies.add(key, time.perf_counter() - started)
+                    return fut.result(), won
+        raise first.exception()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**asdict(self.stats), "percentile": self.percentile}
+
+
+# Process-wide, like the scheduler: latency history is shared by every session.
+_hedger: Hedger | None = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    global _hedger
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger.from_env()
+        return _hedger
+
+
+def set_hedger(hedger: Hedger) -> None:
+    global _hedger
+    with _hedger_lock:
+        _hedger = hedger
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from breaker import get_breaker
+from bulk import iter_parent_weights
+from graph import MAX_CONCURRENCY
+from persistent_cache import DEFAULT_PATH
+
+# Durable bulk parent-topic jobs. Inputs and finished rows live in SQLite
+# (KG_JOBS_PATH, default .kg_cache/jobs.sqlite3). A job is processed in chunks
+# of CHUNK_SIZE topics; each chunk's rows are committed in one transaction, so
+# after a crash or restart the job resumes from the first uncommitted chunk and
+# at most one chunk is redone. Progress views read counts and pages from the
+# store instead of holding the results in memory. Topics the API cannot answer
+# during an outage are not committed as errors: the job waits until the circuit
+# breaker lets calls through again and retries them.
+
+CHUNK_SIZE = 200
+OUTAGE_WAIT = 5.0  # seconds between retries of a chunk while the API is unavailable
+
+
+def job_id(topics: list[str], fused: bool) -> str:
+    # Same topics and mode -> same job, so resubmitting an input resumes it.
+    h = hashlib.sha256(json.dumps([fused, topics]).encode())
+    return h.hexdigest()[:16]
+
+
+class JobStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, name TEXT, fused INTEGER NOT NULL, total INTEGER NOT NULL, created REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS inputs ("
+            " job TEXT NOT NULL, idx INTEGER NOT NULL, topic TEXT NOT NULL, PRIMARY KEY (job, idx));"
+            "CREATE TABLE IF NOT EXISTS results ("
+            " job TEXT NOT NULL, idx INTEGER NOT NULL, row TEXT NOT NULL, error INTEGER NOT NULL,"
+            " PRIMARY KEY (job, idx));"
+        )
+        self._lock = threading.Lock()
+
+    def create(self, topics: list[str], fused: bool, name: str = "") -> str:
+        jid = job_id(topics, fused)
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM jobs WHERE id=?", (jid,)).fetchone():
+                return jid
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?)",
+                               (jid, name or topics[0], int(fused), len(topics), time.time()))
+            self._conn.executemany("INSERT INTO inputs VALUES (?, ?, ?)", ((jid, i, t) for i, t in enumerate(topics)))
+            self._conn.execute("COMMIT")
+        return jid
+
+    def job(self, jid: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT name, fused, total, created FROM jobs WHERE id=?", (jid,)).fetchone()
+        if row is None:
+            raise KeyError(jid)
+        return {"id": jid, "name": row[0], "fused": bool(row[1]), "total": row[2], "created": row[3]}
+
+    def jobs(self) -> list[dict]:
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute("SELECT id FROM jobs ORDER BY created DESC")]
+        return [self.job(jid) for jid in ids]
+
+    def progress(self, jid: str) -> dict:
+        with self._lock:
+            done, errors = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(error), 0) FROM results WHERE job=?", (jid,)).fetchone()
+        total = self.job(jid)["total"]
+        return {"total": total, "done": done, "errors": errors, "finished": done >= total}
+
+    def missing(self, jid: str, start: int, stop: int) -> list[tuple[int, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT i.idx, i.topic FROM inputs i LEFT JOIN results r ON r.job=i.job AND r.idx=i.idx"
+                " WHERE i.job=? AND i.idx>=? AND i.idx<? AND r.idx IS NULL ORDER BY i.idx",
+                (jid, start, stop),
+            ).fetchall()
+
+    def commit(self, jid: str, rows: list[tuple[int, dict]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                   ((jid, i, json.dumps(row), int('Error' in row)) for i, row in rows))
+            self._conn.execute("COMMIT")
+
+    def rows(self, jid: str, limit: int = -1, offset: int = 0, newest: bool = False) -> list[dict]:
+        order = "DESC" if newest else "ASC"
+        with self._lock:
+            cur = self._conn.execute(f"SELECT row FROM results WHERE job=? ORDER BY idx {order} LIMIT ? OFFSET ?",
+                                     (jid, limit, offset))
+            return [json.loads(r[0]) for r in cur]
+
+    def iter_rows(self, jid: str, page: int = 5000):
+        offset = 0
+        while True:
+            batch = self.rows(jid, page, offset)
+            yield from batch
+            if len(batch) < page:
+                return
+            offset += page
+
+    def retry_errors(self, jid: str) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM results WHERE job=? AND error=1", (jid,)).rowcount
+
+    def delete(self, jid: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for table, col in (("results", "job"), ("inputs", "job"), ("jobs", "id")):
+                self._conn.execute(f"DELETE FROM {table} WHERE {col}=?", (jid,))
+            self._conn.execute("COMMIT")
+
+
+def run_job(store: JobStore, jid: str, max_workers: int = MAX_CONCURRENCY, chunk_size: int = CHUNK_SIZE,
+            stop: threading.Event | None = None) -> None:
+    job = store.job(jid)
+    stop = stop or threading.Event()
+    for start in range(0, job["total"], chunk_size):
+        while not stop.is_set():
+            todo = store.missing(jid, start, start + chunk_size)
+            if not todo:
+                break
+            rows = iter_parent_weights([t for _, t in todo], max_workers, job["fused"], skip_unavailable=True)
+            done = [(todo[i][0], row) for i, row in rows if row is not None]
+            store.commit(jid, done)
+            if len(done) < len(todo):
+                stop.wait(max(get_breaker().snapshot()["retry_in_s"], OUTAGE_WAIT))
+        if stop.is_set():
+            return
+
+
+# Jobs run on background threads owned by the process, so they keep going when
+# the browser tab that started them disconnects.
+_store: JobStore | None = None
+_running: dict[str, tuple[threading.Thread, threading.Event]] = {}
+_jobs_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    global _store
+    with _jobs_lock:
+        if _store is None:
+            _store = JobStore(os.environ.get("KG_JOBS_PATH", os.path.join(DEFAULT_PATH, "jobs.sqlite3")))
+        return _store
+
+
+def is_running(jid: str) -> bool:
+    with _jobs_lock:
+        entry = _running.get(jid)
+        return entry is not None and entry[0].is_alive()
+
+
+def start_job(jid: str, max_workers: int = MAX_CONCURRENCY, chunk_size: int = CHUNK_SIZE) -> bool:
+    """Run or resume a job in the background; False if it is already running."""
+    store = get_job_store()
+    with _jobs_lock:
+        entry = _running.get(jid)
+        if entry is not None and entry[0].is_alive():
+            return False
+        stop = threading.Event()
+        thread = threading.Thread(target=run_job, args=(store, jid, max_workers, chunk_size, stop),
+                                  name=f"bulk-job-{jid}", daemon=True)
+        _running[jid] = (thread, stop)
+        thread.start()
+        return True
+
+
+def stop_job(jid: str) -> None:
+    # Stops after the chunk in progress has been committed.
+    with _jobs_lock:
+        entry = _running.get(jid)
+    if entry is not None:
+        entry[1].set()
@@ -0,0 +1,64 @@
+import json
+
+# Incremental parsing for streamed completions. ArrayItemParser is fed text as
+# it arrives and hands back each string element of the answer's array as soon
+# as its closing quote is seen, so callers can act on the first items of an
+# answer while the rest is still being generated. The array is either the root
+# value or the root object's "items" value ({"items": [...]}), the two shapes the
+# full-answer parse accepts; everything else, including arrays under other
+# keys, is skipped without buffering.
+
+
+class ArrayItemParser:
+    def __init__(self):
+        self.depth = 0
+        self.array_depth: int | None = None  # nesting level of the array being read
+        self.done = False
+        self._root: str | None = None  # "[" or "{"
+        self._string: str | None = None  # last string closed in the root object
+        self._key: str | None = None  # key of the root object's value being read
+        self._in_string = False
+        self._escape = False
+        self._buf: list[str] = []
+
+    def feed(self, text: str) -> list[str]:
+        items = []
+        for ch in text:
+            if self.done:
+                break
+            if self._in_string:
+                self._buf.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self.depth == self.array_depth or (self.depth == 1 and self._root == "{"):
+                        try:
+                            value = json.loads("".join(self._buf))
+                        except json.JSONDecodeError:
+                            value = None  # the final full-answer parse reports it
+                        if self.depth == self.array_depth:
+                            if value is not None:
+                                items.append(value)
+                        else:
+                            self._string = value
+                    self._buf = []
+            elif ch == '"':
+                self._in_string = True
+                self._buf = ['"']
+            elif ch in "[{":
+                self.depth += 1
+                if self.depth == 1:
+                    self._root = ch
+                if ch == "[" and self.array_depth is None and (
+                        self.depth == 1 or (self.depth == 2 and self._root == "{" and self._key == "items")):
+                    self.array_depth = self.depth
+            elif ch in ":," and self.depth == 1 and self._root == "{":
+                self._key = self._string if ch == ":" else None
+            elif ch in "]}":
+                if self.depth == self.array_depth:
+                    self.done = True
+                self.depth -= 1
+        return items
@@ -0,0 +1,125 @@
+import networkx as nx
+import numpy as np
+
+# Server-side graph layout, so the browser can draw with physics turned off.
+# force_layout is a vectorized Fruchterman-Reingold: pairwise repulsion is
+# computed in row blocks (bounded memory), edge attraction with np.add.at, and a
+# weak pull towards the origin keeps disconnected pieces on screen.
+# networkx.spring_layout is the reference implementation of the same model.
+# radial_layout is linear-time for very large graphs: nodes sit on rings by BFS
+# depth from the seed, each subtree owning an angular wedge sized by its leaves.
+
+LAYOUTS = ("auto", "numpy", "radial", "networkx")
+SCALE = 1000.0  # vis.js canvas units
+FORCE_MAX_NODES = 3000  # above this "auto" switches from O(n^2) forces to the O(n) radial layout
+
+
+def force_layout(G: nx.Graph, iterations: int = 60, seed: int = 0, gravity: float = 0.05,
+                 block: int = 512) -> dict:
+    nodes = list(G.nodes)
+    n = len(nodes)
+    if n == 0:
+        return {}
+    if n == 1:
+        return {nodes[0]: (0.0, 0.0)}
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(index[u], index[v]) for u, v in G.edges if u != v], dtype=np.intp).reshape(-1, 2)
+    pos = np.random.default_rng(seed).uniform(-0.5, 0.5, (n, 2)).astype(np.float32)
+    k2 = np.float32(1.0 / n)  # k = 1 / sqrt(n): ideal edge length in the unit square
+    k = np.sqrt(k2)
+    temp = 0.1
+    cooling = temp / (iterations + 1)
+    for _ in range(iterations):
+        x, y = pos[:, 0], pos[:, 1]
+        disp = np.zeros_like(pos)
+        for start in range(0, n, block):
+            dx = x[start:start + block, None] - x[None, :]
+            dy = y[start:start + block, None] - y[None, :]
+            w = k2 / np.maximum(dx * dx + dy * dy, 1e-9)
+            disp[start:start + block, 0] = (dx * w).sum(axis=1)
+            disp[start:start + block, 1] = (dy * w).sum(axis=1)
+        if len(edges):
+            delta = pos[edges[:, 0]] - pos[edges[:, 1]]
+            dist = np.maximum(np.linalg.norm(delta, axis=1), 1e-9)
+            pull = delta * (dist / k)[:, None]
+            np.add.at(disp, edges[:, 0], -pull)
+            np.add.at(disp, edges[:, 1], pull)
+        disp -= gravity * pos * (n * k)
+        length = np.maximum(np.linalg.norm(disp, axis=1), 1e-9)
+        pos += disp * (np.minimum(length, temp) / length)[:, None]
+        temp -= cooling
+    pos -= pos.mean(axis=0)
+    pos *= SCALE / max(np.abs(pos).max(), 1e-9)
+    return {node: (float(x), float(y)) for node, (x, y) in zip(nodes, pos)}
+
+
+def networkx_layout(G: nx.Graph, iterations: int = 60, seed: int = 0) -> dict:
+    try:
+        pos = nx.spring_layout(G, iterations=iterations, seed=seed, scale=SCALE)
+    except ImportError:
+        # spring_layout needs scipy above ~500 nodes; it is not a requirement here.
+        return force_layout(G, iterations, seed)
+    return {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+
+
+def radial_layout(G: nx.Graph, root=None) -> dict:
+    if G.number_of_nodes() == 0:
+        return {}
+    if root is None:
+        root = next((n for n, d in G.nodes(data="depth") if d == 0), None)
+    # BFS tree over every component; extra components hang off a virtual root.
+    virtual = object()
+    roots = [root] if root is not None else []
+    seen = set(roots)
+    for comp in nx.connected_components(G):
+        if not seen & comp:
+            r = max(comp, key=G.degree)
+            roots.append(r)
+            seen.add(r)
+    children = {virtual: roots}
+    depth = {virtual: 0, **{r: 1 for r in roots}}
+    order = [virtual]
+    frontier = list(roots)
+    while frontier:
+        order.extend(frontier)
+        nxt = []
+        for u in frontier:
+            kids = [v for v in G[u] if v not in seen]
+            seen.update(kids)
+            children[u] = kids
+            for v in kids:
+                depth[v] = depth[u] + 1
+            nxt.extend(kids)
+        frontier = nxt
+    leaves = {}
+    for u in reversed(order):
+        leaves[u] = sum(leaves[v] for v in children.get(u, ())) or 1
+    pos, span = {}, {virtual: (0.0, 2 * np.pi)}
+    single = len(roots) == 1
+    for u in order:
+        start, width = span[u]
+        if u is not virtual:
+            r = (depth[u] - 1) if single else depth[u]
+            theta = start + width / 2
+            pos[u] = (r * np.cos(theta), r * np.sin(theta))
+        for v in children.get(u, ()):
+            share = width * leaves[v] / leaves[u]
+            span[v] = (start, share)
+            start += share
+    rmax = max(max(abs(x), abs(y)) for x, y in pos.values()) or 1.0
+    return {n: (float(x * SCALE / rmax), float(y * SCALE / rmax)) for n, (x, y) in pos.items()}
+
+
+def ensure_layout(G: nx.Graph, method: str = "auto") -> dict:
+    """Positions for G, computed once and kept in G.graph alongside the graph."""
+    cached = G.graph.get("layout")
+    if cached and cached["method"] == method and cached["n"] == G.number_of_nodes() \
+            and cached["m"] == G.number_of_edges():
+        return cached["pos"]
+    if method == "auto":
+        method_used = "numpy" if G.number_of_nodes() <= FORCE_MAX_NODES else "radial"
+    else:
+        method_used = method
+    pos = {"numpy": force_layout, "radial": radial_layout, "networkx": networkx_layout}[method_used](G)
+    G.graph["layout"] = {"method": method, "n": G.number_of_nodes(), "m": G.number_of_edges(), "pos": pos}
+    return pos
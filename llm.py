@@ -0,0 +1,507 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+import streamlit as st
+
+import persistent_cache
+import telemetry
+from breaker import CircuitOpen, get_breaker
+from hedging import get_hedger
+from jsonstream import ArrayItemParser
+from scheduler import RateLimited, TransientError, get_scheduler
+from singleflight import flights
+
+# ─── CONFIG ────────────────────────────────────────────
+MODEL = "gpt-3.5-turbo"
+PROMPT_VERSION = 2  # bump when prompt wording changes to invalidate persisted completions
+# Structured outputs: send each prompt's JSON schema as response_format. Models
+# matching JSON_SCHEMA_MODELS get a strict json_schema; others (gpt-3.5-turbo)
+# get json_object mode. Answers that still fail validation are retried up to
+# PARSE_RETRIES times and are never cached.
+STRUCTURED_OUTPUT = os.environ.get("KG_STRUCTURED_OUTPUT", "1") != "0"
+JSON_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "o1", "o3", "o4")
+PARSE_RETRIES = int(os.environ.get("KG_PARSE_RETRIES", 2))
+
+# ─── PROMPTS ────────────────────────────────────────────
+NEIGHBOR_PHRASES = {
+    "subtopic": "concise, distinct subtopics of",
+    "related": "concise, distinct concepts related to but not subtopics of",
+    "related_question": "distinct user search queries (as questions) related to",
+}
+BATCH_SIZE = 8  # terms per batched neighbor completion; 1 disables batching
+
+# ─── OUTPUT SCHEMAS ─────────────────────────────────────
+# Strict schemas need an object at the root, so lists come wrapped in "items".
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+_SCORED = {
+    "type": "object",
+    "properties": {"parent": {"type": "string"}, "score": {"type": "integer"}},
+    "required": ["parent", "score"], "additionalProperties": False,
+}
+
+def _object(properties: dict) -> dict:
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+SCHEMAS = {
+    "neighbors": _object({"items": _STRINGS}),
+    "parents": _object({"items": _STRINGS}),
+    "parent_weights": _object({"items": {"type": "array", "items": _SCORED}}),
+    "parents_fused": _object({"items": {"type": "array", "items": _SCORED}}),
+}
+
+class ParseError(ValueError):
+    """A completion that does not match the JSON shape its prompt asked for."""
+
+def _items(content: str) -> list:
+    data = json.loads(content)
+    if isinstance(data, dict):
+        data = data.get("items")
+    if not isinstance(data, list):
+        raise ParseError("expected a JSON array under 'items'")
+    return data
+
+def _strings(content: str) -> list[str]:
+    items = _items(content)
+    if not all(isinstance(i, str) for i in items):
+        raise ParseError("expected an array of strings")
+    return items
+
+def _scored(content: str) -> pd.DataFrame:
+    df = pd.DataFrame(_items(content))
+    if df.empty:
+        return pd.DataFrame({'parent': [], 'score': []})
+    df = df[['parent', 'score']]
+    df['parent'] = df['parent'].astype(str)
+    df['score'] = pd.to_numeric(df['score'], errors='coerce').fillna(0).astype(int)
+    return df.sort_values('score', ascending=False).reset_index(drop=True)
+
+# ─── LLM BACKENDS ───────────────────────────────────────
+@dataclass
+class LLMRequest:
+    system: str
+    prompt: str
+    temperature: float
+    task: str  # neighbors | neighbors_batch | parents | parent_weights | parents_fused
+    params: dict = field(default_factory=dict)  # structured inputs the prompt was built from
+    schema: dict | None = None  # JSON schema the answer must follow
+
+class LLMBackend:
+    model = MODEL  # part of every persistent cache key, so backends never share entries
+
+    def complete(self, req: LLMRequest) -> str:
+        raise NotImplementedError
+
+    def stream(self, req: LLMRequest):
+        # Text chunks as they are generated; backends without streaming send one.
+        yield self.complete(req)
+
+def _api_key() -> str:
+    try:
+        return st.secrets["OPENAI_API_KEY"]
+    except Exception:
+        return os.environ["OPENAI_API_KEY"]
+
+@st.cache_resource
+def get_openai_client():
+    # Built on first use rather than at import, and shared by every session.
+    # Retries belong to the scheduler, so the client's own are turned off.
+    from openai import OpenAI
+    return OpenAI(api_key=_api_key(), max_retries=0)
+
+def _retry_after(headers) -> float | None:
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+def _response_format(schema: dict | None) -> dict | None:
+    if schema is None or not STRUCTURED_OUTPUT:
+        return None
+    if MODEL.startswith(JSON_SCHEMA_MODELS):
+        return {"type": "json_schema", "json_schema": {"name": "answer", "strict": True, "schema": schema}}
+    return {"type": "json_object"}
+
+class OpenAIBackend(LLMBackend):
+    def _create(self, req: LLMRequest, **kw):
+        fmt = _response_format(req.schema)
+        return get_openai_client().chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": req.system},
+                {"role": "user", "content": req.prompt}
+            ],
+            temperature=req.temperature,
+            **({"response_format": fmt} if fmt else {}),
+            **kw
+        )
+
+    def complete(self, req: LLMRequest) -> str:
+        import openai
+        try:
+            resp = self._create(req)
+        except openai.RateLimitError as e:
+            raise RateLimited(str(e), _retry_after(e.response.headers)) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise TransientError(str(e)) from e
+        if resp.usage is not None:
+            telemetry.usage(resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return resp.choices[0].message.content
+
+    def stream(self, req: LLMRequest):
+        import openai
+        try:
+            for chunk in self._create(req, stream=True, stream_options={"include_usage": True}):
+                if chunk.usage is not None:
+                    telemetry.usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except openai.RateLimitError as e:
+            raise RateLimited(str(e), _retry_after(e.response.headers)) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise TransientError(str(e)) from e
+
+_llm_backend: LLMBackend | None = None
+
+def get_llm_backend() -> LLMBackend:
+    # KG_LLM_BACKEND=fake runs the whole app offline against fake_llm.FakeLLMBackend.
+    global _llm_backend
+    if _llm_backend is None:
+        if os.environ.get("KG_LLM_BACKEND", "openai").lower() == "fake":
+            from fake_llm import FakeLLMBackend
+            _llm_backend = FakeLLMBackend.from_env()
+        else:
+            _llm_backend = OpenAIBackend()
+    return _llm_backend
+
+def set_llm_backend(backend: LLMBackend) -> None:
+    global _llm_backend
+    _llm_backend = backend
+
+API_CALLS = {"count": 0}  # completions sent by this process
+_api_calls_lock = threading.Lock()
+
+# Failures that mean "no answer from the API right now" rather than a bad answer:
+# callers building from the cache leave those branches unfetched.
+UNAVAILABLE = (CircuitOpen, RateLimited, TransientError)
+
+def current_model() -> str:
+    return get_llm_backend().model
+
+def _estimate_tokens(req: LLMRequest) -> int:
+    # Rough budget for the token bucket: ~4 characters per prompt token plus an
+    # allowance of ~12 tokens per requested item in the answer.
+    items = req.params.get("limit", 5) * len(req.params.get("terms", [None]))
+    return (len(req.system) + len(req.prompt)) // 4 + 12 * items
+
+PARSE_STATS = {"failures": 0, "gave_up": 0}  # answers that failed validation / calls that ran out of retries
+
+def _call_api(attempt, req: LLMRequest) -> str:
+    # Through the circuit breaker (fails fast during an outage), then the
+    # scheduler's rate limits and retries; retries stop once the breaker opens.
+    breaker = get_breaker()
+
+    def guarded():
+        if breaker.is_open:
+            raise CircuitOpen("LLM API calls paused")
+        try:
+            content = attempt()
+        except TransientError:
+            # Outages only: rate limits are the scheduler's, and other errors (bad
+            # key, bad request) say nothing about whether the API is up.
+            breaker.failure()
+            raise
+        breaker.success()
+        return content
+
+    def send():
+        with _api_calls_lock:
+            API_CALLS["count"] += 1
+        return get_scheduler().call(guarded, tokens=_estimate_tokens(req))
+    return breaker.call(send)
+
+def _complete(system: str, prompt: str, temperature: float, task: str, parse=None, schema=None, **params):
+    # With parse, returns parse(content); answers it rejects (ValueError, KeyError,
+    # TypeError) are asked again up to PARSE_RETRIES times, then raise ParseError.
+    req = LLMRequest(system, prompt, temperature, task, params, schema or SCHEMAS.get(task))
+    backend = get_llm_backend()
+    hedger = get_hedger()
+
+    def attempt():
+        with telemetry.attempt():
+            return backend.complete(req)
+    with telemetry.track_call(task, backend.model, params.get("rel")) as rec:
+        # Each request of a (possibly hedged) ask reports into its own record: the
+        # first answer is billed to rec, the other request of a hedge is logged
+        # on its own as overhead once it finishes.
+        def send(race: dict):
+            sub = telemetry.CallRecord(rec.task, rec.stage, rec.rel, rec.model, hedge=True)
+            with _api_calls_lock:
+                race["sent"] += 1
+            started = time.perf_counter()
+            try:
+                with telemetry.recording(sub):
+                    return _call_api(attempt, req)
+            except BaseException as e:
+                sub.error = type(e).__name__
+                raise
+            finally:
+                sub.latency = time.perf_counter() - started
+                with _api_calls_lock:
+                    first = sub.error is None and not race["answered"]
+                    race["answered"] |= first
+                    alone = race["sent"] == 1
+                if first or alone:
+                    rec.absorb(sub)
+                else:
+                    telemetry.emit(sub)
+
+        for retry in range(PARSE_RETRIES + 1):
+            race = {"sent": 0, "answered": False}
+            content, won = hedger.call(f"{task}:{params.get('rel', '')}", lambda: send(race), lambda: send(race))
+            rec.hedged |= race["sent"] > 1
+            rec.hedge_won |= won
+            if parse is None:
+                return content
+            try:
+                return parse(content)
+            except (ValueError, KeyError, TypeError) as e:
+                error = e
+                rec.parse_failures += 1
+                with _api_calls_lock:
+                    PARSE_STATS["failures"] += 1
+        with _api_calls_lock:
+            PARSE_STATS["gave_up"] += 1
+        raise ParseError(f"{task}: {error}") from error
+
+def _complete_stream(system: str, prompt: str, temperature: float, task: str, on_item, parse, **params):
+    # Streams the answer, calling on_item(item) for each array element as soon as
+    # it is complete, and returns parse(full answer). Items already delivered
+    # cannot be taken back, so a rejected answer raises ParseError without
+    # another attempt; a retried stream (429, dropped connection) only delivers
+    # items not seen before.
+    req = LLMRequest(system, prompt, temperature, task, params, SCHEMAS.get(task))
+    backend = get_llm_backend()
+    seen = set()
+
+    with telemetry.track_call(task, backend.model, params.get("rel")) as rec:
+        started = time.perf_counter()
+
+        def attempt():
+            parser, parts = ArrayItemParser(), []
+            with telemetry.attempt():
+                for chunk in backend.stream(req):
+                    parts.append(chunk)
+                    for item in parser.feed(chunk):
+                        if isinstance(item, str) and item not in seen:
+                            if not seen:
+                                rec.first_item = time.perf_counter() - started
+                            seen.add(item)
+                            on_item(item)
+            return "".join(parts)
+        content = _call_api(attempt, req)
+        try:
+            return parse(content)
+        except (ValueError, KeyError, TypeError) as e:
+            rec.parse_failures += 1
+            with _api_calls_lock:
+                PARSE_STATS["failures"] += 1
+                PARSE_STATS["gave_up"] += 1
+            raise ParseError(f"{task}: {e}") from e
+
+# ─── HELPERS ────────────────────────────────────────────
+def _neighbor_prompt(term: str, rel: str, limit: int) -> str:
+    return (f"Provide up to {limit} {NEIGHBOR_PHRASES[rel]} '{term}', "
+            "as a JSON object with an 'items' array of strings.")
+
+@persistent_cache.persistent("get_llm_neighbors", limit_arg="limit",
+                             model=current_model, temperature=0.7, prompt_version=PROMPT_VERSION)
+def _llm_neighbors(term: str, rel: str, limit: int) -> list[str]:
+    if rel not in NEIGHBOR_PHRASES:
+        return []
+    return _complete("Output only a JSON object.", _neighbor_prompt(term, rel, limit), 0.7, "neighbors", _strings,
+                     term=term, rel=rel, limit=limit)[:limit]
+
+# The @st.cache_data entry points memoize on the script thread only; pool
+# workers call the persistent functions (_llm_neighbors, _parent_topics, ...)
+# directly, since st.cache_data needs a ScriptRunContext.
+@st.cache_data(ttl=persistent_cache.FRONT_TTL)
+def get_llm_neighbors(term: str, rel: str, limit: int) -> list[str]:
+    return _llm_neighbors(term, rel, limit)
+
+def stream_llm_neighbors(term: str, rel: str, limit: int, on_item) -> list[str]:
+    # get_llm_neighbors, but on_item(neighbor) is called for each neighbor as the
+    # completion streams in. Cached and in-flight answers are replayed at once;
+    # the finished answer is cached under the same key as get_llm_neighbors.
+    hit = _llm_neighbors.lookup(term, rel, limit)
+    if hit is None:
+        key = _llm_neighbors.key_for(term, rel, limit)
+        call, leader = flights.claim(key)
+        if not leader:
+            hit = call.wait() or []  # only the leader may finish the key
+    if hit is not None:
+        for item in hit:
+            on_item(item)
+        return hit
+    delivered = []
+
+    def deliver(item):
+        if len(delivered) < limit:
+            delivered.append(item)
+            on_item(item)
+    try:
+        if rel not in NEIGHBOR_PHRASES:
+            result = []
+        else:
+            result = _complete_stream("Output only a JSON object.", _neighbor_prompt(term, rel, limit), 0.7,
+                                      "neighbors", deliver, _strings, term=term, rel=rel, limit=limit)[:limit]
+    except ParseError:
+        flights.finish(key, delivered)  # what arrived is used for this run but not cached
+        return delivered
+    except BaseException as e:
+        flights.finish(key, error=e)
+        raise
+    _llm_neighbors.store(result, term, rel, limit)
+    flights.finish(key, result)
+    return result
+
+def _batch(content: str) -> dict:
+    parsed = json.loads(content)
+    if not isinstance(parsed, dict):
+        raise ParseError("expected a JSON object")
+    return parsed
+
+def get_llm_neighbors_batch(terms: list[str], rel: str, limit: int) -> dict[str, list[str]]:
+    # One completion for many terms of the same relation. Each term's answer is
+    # stored under the same persistent-cache key a single-term call would use;
+    # keys missing or malformed in the response fall back to single-term calls.
+    # Terms already in flight elsewhere are waited on rather than asked again.
+    # Terms that cannot be answered while the API is unavailable (breaker open,
+    # retries exhausted) are left out of the result.
+    out = {}
+    down = None
+    for t in terms:
+        hit = _llm_neighbors.lookup(t, rel, limit)
+        if hit is not None:
+            out[t] = hit
+    keys = {t: _llm_neighbors.key_for(t, rel, limit) for t in dict.fromkeys(terms) if t not in out}
+    claims = {t: flights.claim(k) for t, k in keys.items()}
+    todo = [t for t, (_, leader) in claims.items() if leader]
+    try:
+        if len(todo) > 1 and rel in NEIGHBOR_PHRASES:
+            prompt = (
+                f"For each term in {json.dumps(todo)}, provide up to {limit} {NEIGHBOR_PHRASES[rel]} that term. "
+                "Respond with a JSON object whose keys are exactly those terms and whose values are JSON arrays of strings."
+            )
+            schema = _object({t: _STRINGS for t in todo})
+            try:
+                parsed = _complete("Output only a JSON object.", prompt, 0.7, "neighbors_batch", _batch, schema,
+                                   terms=todo, rel=rel, limit=limit)
+            except ParseError:
+                parsed = {}
+            except UNAVAILABLE as e:
+                parsed, down = {}, e
+            if parsed:
+                by_norm = {str(k).strip().lower(): v for k, v in parsed.items()}
+                for t in todo:
+                    items = by_norm.get(t.strip().lower())
+                    if isinstance(items, list) and items and all(isinstance(i, str) for i in items):
+                        out[t] = items[:limit]
+                        _llm_neighbors.store(out[t], t, rel, limit)
+        for t in todo:
+            if t not in out and down is None:
+                # This call leads the flight for t, so go around the single-flight wrapper.
+                try:
+                    out[t] = _llm_neighbors.__wrapped__(t, rel, limit)
+                except ParseError:
+                    out[t] = []  # counted in PARSE_STATS; nothing is cached
+                    continue
+                except UNAVAILABLE as e:
+                    down = e
+                    continue
+                _llm_neighbors.store(out[t], t, rel, limit)
+    except BaseException as e:
+        for t in todo:
+            flights.finish(keys[t], error=e)
+        raise
+    for t in todo:
+        if t in out:
+            flights.finish(keys[t], out[t])
+        else:
+            flights.finish(keys[t], error=down)
+    for t, (call, leader) in claims.items():
+        if not leader:
+            try:
+                out[t] = call.wait()
+            except ParseError:
+                out[t] = []  # the leader got no usable answer; nothing was cached
+            except UNAVAILABLE:
+                pass
+    return out
+
+@persistent_cache.persistent("find_parent_topics", limit_arg="limit",
+                             model=current_model, temperature=0, prompt_version=PROMPT_VERSION)
+def _parent_topics(topic: str, limit: int = 5) -> list[str]:
+    prompt = (
+        f"Provide up to {limit} higher-level topics or domains that '{topic}' is a subtopic of, "
+        "as a JSON object with an 'items' array of strings."
+    )
+    return _complete("Output only a JSON object.", prompt, 0, "parents", _strings, topic=topic, limit=limit)[:limit]
+
+@st.cache_data(ttl=persistent_cache.FRONT_TTL)
+def find_parent_topics(topic: str, limit: int = 5) -> list[str]:
+    return _parent_topics(topic, limit)
+
+@persistent_cache.persistent(
+    "find_parent_topic_weights", encode=lambda df: df.to_dict("records"), decode=pd.DataFrame,
+    model=current_model, temperature=0, prompt_version=PROMPT_VERSION,
+)
+def _parent_topic_weights(topic: str, candidates: list[str]) -> pd.DataFrame:
+    prompt = (
+        f"For the topic '{topic}', assign a relevance score from 0 to 100 to each of the following higher-level domains: "
+        f"{', '.join(candidates)}. Respond only as a JSON object with an 'items' array of objects with "
+        "'parent' and 'score' fields."
+    )
+    return _complete("Output only a JSON object.", prompt, 0, "parent_weights", _scored,
+                     topic=topic, candidates=candidates)
+
+@st.cache_data(ttl=persistent_cache.FRONT_TTL)
+def find_parent_topic_weights(topic: str, candidates: list[str]) -> pd.DataFrame:
+    return _parent_topic_weights(topic, candidates)
+
+@persistent_cache.persistent(
+    "find_parent_weights_fused", encode=lambda df: df.to_dict("records"), decode=pd.DataFrame, limit_arg="limit",
+    model=current_model, temperature=0, prompt_version=PROMPT_VERSION,
+)
+def _fused_parent_weights(topic: str, limit: int) -> pd.DataFrame:
+    prompt = (
+        f"List up to {limit} higher-level topics or domains that '{topic}' is a subtopic of, and assign each a "
+        "relevance score from 0 to 100. Respond only as a JSON object with an 'items' array of objects with "
+        "'parent' and 'score' fields."
+    )
+    df = _complete("Output only a JSON object.", prompt, 0, "parents_fused", _scored, topic=topic, limit=limit)
+    return df.head(limit)
+
+def _parents_fused(topic: str, limit: int = 5) -> pd.DataFrame:
+    # Parents and scores from one completion; falls back to the two-step path when
+    # the fused answer cannot be parsed.
+    try:
+        return _fused_parent_weights(topic, limit)
+    except ParseError:
+        parents = _parent_topics(topic, limit)
+        if not parents:
+            return pd.DataFrame({'parent': [], 'score': []})
+        return _parent_topic_weights(topic, parents)
+
+@st.cache_data(ttl=persistent_cache.FRONT_TTL)
+def find_parent_weights_fused(topic: str, limit: int = 5) -> pd.DataFrame:
+    return _parents_fused(topic, limit)
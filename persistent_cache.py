@@ -0,0 +1,450 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+import telemetry
+from breaker import get_breaker
+from singleflight import flights
+
+# Persistent second-level cache for LLM completions. Streamlit's @st.cache_data
+# stays in front as the per-process cache; this layer survives restarts and
+# redeploys. Configure with KG_CACHE_BACKEND (sqlite | shard | none),
+# KG_CACHE_PATH, KG_CACHE_TTL (seconds, 0 = never expire) and KG_CACHE_MAX_ENTRIES.
+#
+# Entries older than KG_CACHE_REFRESH_AFTER (seconds, 0 = never) are stale:
+# they are still served at once, and a background refresh replaces them. No
+# refreshes are sent while the circuit breaker is open.
+#
+# Entries can also belong to a "family" with a size: the same call with a
+# different limit. A request for limit k is answered by slicing the smallest
+# stored family member with size >= k, so asking for fewer items never costs a
+# new completion.
+
+DEFAULT_PATH = ".kg_cache"
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_REFRESH_AFTER = 7 * 24 * 3600
+# @st.cache_data in front of this layer memoizes for at most FRONT_TTL seconds,
+# so a stale hit it kept gives way to the refreshed entry within that time.
+FRONT_TTL = min(float(os.environ.get("KG_CACHE_REFRESH_AFTER", DEFAULT_REFRESH_AFTER)) or 3600, 3600)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    superset_hits: int = 0  # hits answered by slicing a larger entry
+    misses: int = 0
+    writes: int = 0
+    expired: int = 0
+    evictions: int = 0
+    stale: int = 0  # hits served while due for a refresh
+    refreshes: int = 0
+    refresh_errors: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "hit_rate": round(self.hit_rate, 3)}
+
+
+def make_key(*parts, **fields) -> str:
+    payload = json.dumps([parts, fields], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CacheBackend:
+    """Key/value store with TTL expiry and LRU eviction. Values must be JSON-serializable."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 refresh_after: float = DEFAULT_REFRESH_AFTER):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh_after = refresh_after
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl) and now - created > self.ttl
+
+    def stale(self, created: float) -> bool:
+        return bool(self.refresh_after) and time.time() - created > self.refresh_after
+
+    def count(self, stat: str) -> None:
+        with self._lock:
+            setattr(self.stats, stat, getattr(self.stats, stat) + 1)
+
+    def entry(self, key: str, family: str | None = None) -> tuple | None:
+        """(value, created) of a live entry, or None."""
+        raise NotImplementedError
+
+    def entry_at_least(self, family: str, size: int) -> tuple | None:
+        """(value, created) of the smallest live entry in family with size >= size, or None."""
+        raise NotImplementedError
+
+    def get(self, key: str, family: str | None = None):
+        hit = self.entry(key, family)
+        return None if hit is None else hit[0]
+
+    def get_at_least(self, family: str, size: int):
+        hit = self.entry_at_least(family, size)
+        return None if hit is None else hit[0]
+
+    def set(self, key: str, value, family: str | None = None, size: int | None = None) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    def entry(self, key, family=None):
+        self.stats.misses += 1
+        return None
+
+    def entry_at_least(self, family, size):
+        self.stats.misses += 1
+        return None
+
+    def set(self, key, value, family=None, size=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class SQLiteCache(CacheBackend):
+    def __init__(self, path: str, **kw):
+        super().__init__(**kw)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if "family" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN family TEXT")
+            self._conn.execute("ALTER TABLE entries ADD COLUMN size INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_family ON entries(family, size)")
+
+    def entry(self, key, family=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM entries WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            if self._expired(row[1], now):
+                self._conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed=? WHERE key=?", (now, key))
+            self.stats.hits += 1
+            return json.loads(row[0]), row[1]
+
+    def entry_at_least(self, family, size):
+        now = time.time()
+        with self._lock:
+            if self.ttl:
+                purged = self._conn.execute(
+                    "DELETE FROM entries WHERE family=? AND created<?", (family, now - self.ttl)
+                ).rowcount
+                self.stats.expired += purged
+            row = self._conn.execute(
+                "SELECT key, value, size, created FROM entries WHERE family=? AND size>=? ORDER BY size LIMIT 1",
+                (family, size),
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed=? WHERE key=?", (now, row[0]))
+            self.stats.hits += 1
+            self.stats.superset_hits += row[2] > size
+            return json.loads(row[1]), row[3]
+
+    def set(self, key, value, family=None, size=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created, accessed, family, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(value), now, now, family, size),
+            )
+            self.stats.writes += 1
+            overflow = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                    (overflow,),
+                )
+                self.stats.evictions += overflow
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class ShardedFileCache(CacheBackend):
+    """One JSON file per shard; keys are spread across shards by hash prefix."""
+
+    def __init__(self, directory: str, shards: int = 64, **kw):
+        super().__init__(**kw)
+        self.directory = directory
+        self.shards = shards
+        self._loaded: dict[int, dict] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _shard_of(self, key: str) -> int:
+        return int(key[:8], 16) % self.shards
+
+    def _path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"shard_{shard:03d}.json")
+
+    def _load(self, shard: int) -> dict:
+        if shard not in self._loaded:
+            try:
+                with open(self._path(shard)) as f:
+                    self._loaded[shard] = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._loaded[shard] = {}
+        return self._loaded[shard]
+
+    def _flush(self, shard: int) -> None:
+        tmp = self._path(shard) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._loaded[shard], f)
+        os.replace(tmp, self._path(shard))
+
+    def entry(self, key, family=None):
+        now = time.time()
+        shard = self._shard_of(family or key)
+        with self._lock:
+            entries = self._load(shard)
+            entry = entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            if self._expired(entry[1], now):
+                del entries[key]
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            # Access times are persisted with the next write to this shard.
+            entry[2] = now
+            self.stats.hits += 1
+            return entry[0], entry[1]
+
+    def entry_at_least(self, family, size):
+        now = time.time()
+        with self._lock:
+            entries = self._load(self._shard_of(family))
+            best = None
+            for key, entry in list(entries.items()):
+                if len(entry) < 5 or entry[3] != family or entry[4] < size:
+                    continue
+                if self._expired(entry[1], now):
+                    del entries[key]
+                    self.stats.expired += 1
+                elif best is None or entry[4] < best[4]:
+                    best = entry
+            if best is None:
+                self.stats.misses += 1
+                return None
+            best[2] = now
+            self.stats.hits += 1
+            self.stats.superset_hits += best[4] > size
+            return best[0], best[1]
+
+    def set(self, key, value, family=None, size=None):
+        now = time.time()
+        # Family members share a shard so get_at_least only has to scan one file.
+        shard = self._shard_of(family or key)
+        cap = max(1, self.max_entries // self.shards)
+        with self._lock:
+            entries = self._load(shard)
+            entries[key] = [value, now, now, family, size]
+            self.stats.writes += 1
+            overflow = len(entries) - cap
+            if overflow > 0:
+                for k, _ in sorted(entries.items(), key=lambda kv: kv[1][2])[:overflow]:
+                    del entries[k]
+                self.stats.evictions += overflow
+            self._flush(shard)
+
+    def clear(self):
+        with self._lock:
+            for shard in range(self.shards):
+                self._loaded[shard] = {}
+                if os.path.exists(self._path(shard)):
+                    os.remove(self._path(shard))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(self._load(s)) for s in range(self.shards))
+
+
+def backend_from_env() -> CacheBackend:
+    kind = os.environ.get("KG_CACHE_BACKEND", "sqlite").lower()
+    path = os.environ.get("KG_CACHE_PATH", DEFAULT_PATH)
+    kw = {
+        "ttl": float(os.environ.get("KG_CACHE_TTL", DEFAULT_TTL)),
+        "max_entries": int(os.environ.get("KG_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        "refresh_after": float(os.environ.get("KG_CACHE_REFRESH_AFTER", DEFAULT_REFRESH_AFTER)),
+    }
+    if kind == "sqlite":
+        return SQLiteCache(os.path.join(path, "completions.sqlite3"), **kw)
+    if kind == "shard":
+        return ShardedFileCache(os.path.join(path, "shards"), **kw)
+    if kind == "none":
+        return NullCache(**kw)
+    raise ValueError(f"Unknown KG_CACHE_BACKEND: {kind!r}")
+
+
+# This module is imported once per process, so the backend outlives Streamlit reruns.
+_backend: CacheBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> CacheBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = backend_from_env()
+        return _backend
+
+
+def set_backend(backend: CacheBackend) -> None:
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# Stale entries are refreshed off the caller's thread, one refresh per key at a time.
+_refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+_refreshing: set[str] = set()
+_refreshing_lock = threading.Lock()
+
+
+def _revalidate(key: str, compute) -> None:
+    backend = get_backend()
+    with _refreshing_lock:
+        if key in _refreshing or get_breaker().is_open:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            flights.do(key, compute)
+            backend.count("refreshes")
+        except Exception:
+            backend.count("refresh_errors")  # the stale entry stays; a later hit tries again
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+    telemetry.submit(_refresh_pool, telemetry.tagged(refresh, stage="revalidate"))
+
+
+def persistent(name: str, encode=None, decode=None, limit_arg: str | None = None, **key_fields):
+    """Cache a function's return value in the persistent backend.
+
+    The key is the function name, its bound arguments and ``key_fields``
+    (model, temperature, prompt version, ...). Callable field values are
+    evaluated per call, for settings that can change at runtime. With
+    ``limit_arg``, the function must return a list truncated to that argument;
+    calls that differ only in it form one family and are served by slicing a
+    larger cached answer. Stale hits are returned as they are and refreshed in
+    the background.
+    """
+    def deco(fn):
+        sig = inspect.signature(fn)
+
+        def locate(*args, **kwargs) -> tuple[str, str | None, int | None]:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            fields = {k: v() if callable(v) else v for k, v in key_fields.items()}
+            key = make_key(name, args=bound.arguments, **fields)
+            if limit_arg is None:
+                return key, None, None
+            rest = {k: v for k, v in bound.arguments.items() if k != limit_arg}
+            return key, make_key(name, args=rest, **fields), bound.arguments[limit_arg]
+
+        def key_for(*args, **kwargs) -> str:
+            return locate(*args, **kwargs)[0]
+
+        def _get(key: str, family: str | None, size: int | None) -> tuple:
+            backend = get_backend()
+            if family is None:
+                hit = backend.entry(key)
+            else:
+                hit = backend.entry_at_least(family, size)
+                hit = (hit[0][:size], hit[1]) if hit is not None else None
+            if hit is None:
+                return None, False
+            model = key_fields.get("model")
+            telemetry.cache_hit(name, str(model() if callable(model) else model))
+            stale = backend.stale(hit[1])
+            if stale:
+                backend.count("stale")
+            return (decode(hit[0]) if decode else hit[0]), stale
+
+        def _set(slot, value) -> None:
+            key, family, size = slot
+            get_backend().set(key, encode(value) if encode else value, family, size)
+
+        def _fill(slot, args, kwargs):
+            # Returns the value: callers that join this flight get it too.
+            value = fn(*args, **kwargs)
+            _set(slot, value)
+            return value
+
+        def _serve(slot, args, kwargs):
+            value, stale = _get(*slot)
+            if stale:
+                _revalidate(slot[0], functools.partial(_fill, slot, args, kwargs))
+            return value
+
+        def lookup(*args, **kwargs):
+            return _serve(locate(*args, **kwargs), args, kwargs)
+
+        def store(value, *args, **kwargs) -> None:
+            _set(locate(*args, **kwargs), value)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            slot = locate(*args, **kwargs)
+            hit = _serve(slot, args, kwargs)
+            if hit is not None:
+                return hit
+            # Concurrent misses on the same key share one call.
+            return flights.do(slot[0], functools.partial(_fill, slot, args, kwargs))
+
+        # Let callers that compute several results at once (batched prompts)
+        # read and fill the same entries, and join the same flights, as the
+        # wrapped function.
+        wrapper.key_for = key_for
+        wrapper.lookup = lookup
+        wrapper.store = store
+        return wrapper
+    return deco
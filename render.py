@@ -0,0 +1,193 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+import networkx as nx
+import numpy as np
+import streamlit as st
+
+from layout import ensure_layout
+
+# ─── RENDER CACHE ───────────────────────────────────────
+# Generated HTML keyed by graph content, renderer and layout, so reruns and
+# other sessions showing the same graph skip pyvis templating / payload
+# encoding. Process-wide and bounded by total size (KG_RENDER_CACHE_MB),
+# evicting least recently used pages first.
+
+def graph_hash(G: nx.Graph) -> str:
+    nodes = sorted((str(n), sorted(a.items())) for n, a in G.nodes(data=True))
+    edges = sorted(tuple(sorted((str(u), str(v)))) for u, v in G.edges())
+    blob = json.dumps([G.is_directed(), nodes, edges], separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+@dataclass
+class RenderStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+class RenderCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.stats = RenderStats()
+        self._pages: OrderedDict[tuple, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key: tuple, render) -> str:
+        with self._lock:
+            html = self._pages.get(key)
+            if html is not None:
+                self._pages.move_to_end(key)
+                self.stats.hits += 1
+                return html
+            self.stats.misses += 1
+        html = render()
+        size = len(html)
+        if size > self.max_bytes:
+            return html
+        with self._lock:
+            if key not in self._pages:
+                self._pages[key] = html
+                self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, old = self._pages.popitem(last=False)
+                self.bytes -= len(old)
+                self.stats.evictions += 1
+        return html
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+            self.bytes = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**asdict(self.stats), "entries": len(self._pages), "mb": round(self.bytes / 2**20, 1)}
+
+render_cache = RenderCache(int(float(os.environ.get("KG_RENDER_CACHE_MB", 64)) * 2**20))
+
+# ─── VISUALIZE WITH PYVIS ───────────────────────────────
+COLORS = {"seed": "#1f78b4", "subtopic": "#66c2a5", "related": "#61b2ff", "related_question": "#ffcc61"}
+
+MISSING_COLOR = "#d62728"
+
+def _vis_node(node, data) -> dict:
+    vis = {
+        "label": data['label'],
+        "title": f"{data['rel']} (depth {data['depth']})",
+        "color": COLORS.get(data['rel'], "#999999"),
+    }
+    if data.get('missing'):
+        # Branches the LLM API could not be asked for: dashed red outline.
+        vis["title"] += f"\nnot fetched (API unavailable): {data['missing'].replace(',', ', ')}"
+        vis["color"] = {"background": vis["color"], "border": MISSING_COLOR}
+        vis["borderWidth"] = 3
+        vis["shapeProperties"] = {"borderDashes": [4, 3]}
+    elif 'missing' in data:
+        # Fetched since: undo the outline in views that merge node updates.
+        vis["borderWidth"] = 1
+        vis["shapeProperties"] = {"borderDashes": False}
+    return vis
+
+def draw_pyvis(G: nx.Graph, layout: str | None = None) -> str:
+    # With a layout method (see layout.LAYOUTS) positions are computed server-side
+    # and cached on G, and the browser draws them as-is with physics off.
+    return render_cache.get_or_render((graph_hash(G), "pyvis", layout), lambda: _draw_pyvis(G, layout))
+
+def _draw_pyvis(G: nx.Graph, layout: str | None) -> str:
+    from pyvis.network import Network
+    net = Network(height="750px", width="100%", notebook=False)
+    if layout:
+        pos = ensure_layout(G, layout)
+        options = {"physics": {"enabled": False}, "layout": {"improvedLayout": False}}
+    else:
+        pos = {}
+        options = {"physics": {"stabilization": {"iterations": 300}}}
+    options_json = json.dumps({
+        "interaction": {"hover": True, "navigationButtons": True},
+        **options
+    })
+    net.set_options(options_json)
+    for node, data in G.nodes(data=True):
+        xy = {"x": pos[node][0], "y": pos[node][1], "physics": False} if node in pos else {}
+        net.add_node(node, **_vis_node(node, data), **xy)
+    for u, v in G.edges():
+        net.add_edge(u, v)
+    return net.generate_html()
+
+# ─── VISUALIZE WITH WEBGL ───────────────────────────────
+# For graphs too big for vis.js: positions come from ensure_layout, and the
+# browser gets compact little-endian typed arrays (base64) instead of one JSON
+# object per node. components/webgl_graph/graph-gl.js draws them with WebGL and
+# needs no network access.
+_WEBGL_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "webgl_graph", "graph-gl.js")
+WEBGL_SUGGEST_NODES = 1500  # above this pyvis gets sluggish
+
+def _b64(a: np.ndarray) -> str:
+    return base64.b64encode(a.tobytes()).decode("ascii")
+
+def graph_payload(G: nx.Graph, layout: str = "auto") -> dict:
+    pos = ensure_layout(G, layout)
+    nodes = list(G.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    groups = list(COLORS)
+    data = G.nodes(data=True)
+    xy = np.array([pos[node] for node in nodes], dtype="<f4").reshape(-1, 2)
+    edges = np.array([(index[u], index[v]) for u, v in G.edges()], dtype="<u4").reshape(-1, 2)
+    group = np.array([groups.index(data[n]['rel']) if data[n].get('rel') in COLORS else len(groups)
+                      for n in nodes], dtype="u1")
+    depth = np.array([min(data[n].get('depth', 0), 255) for n in nodes], dtype="u1")
+    return {
+        "n": len(nodes),
+        "positions": _b64(xy),
+        "edges": _b64(edges),
+        "groups": _b64(group),
+        "depths": _b64(depth),
+        "labels": [data[n].get('label', str(n)) for n in nodes],
+        "palette": [*COLORS.values(), "#999999"],
+        "group_names": [*groups, "other"],
+        "missing": {i: data[n]['missing'] for i, n in enumerate(nodes) if data[n].get('missing')},
+        "missing_color": MISSING_COLOR,
+    }
+
+def draw_webgl(G: nx.Graph, layout: str = "auto", height: int = 750) -> str:
+    return render_cache.get_or_render((graph_hash(G), "webgl", layout, height), lambda: _draw_webgl(G, layout, height))
+
+def _draw_webgl(G: nx.Graph, layout: str, height: int) -> str:
+    with open(_WEBGL_JS, encoding="utf-8") as f:
+        script = f.read()
+    payload = json.dumps(graph_payload(G, layout), separators=(",", ":")).replace("</", "<\\/")
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>html,body{{margin:0}}</style></head>
+<body><div id="graph" style="width:100%;height:{height}px"></div>
+<script>{script}</script>
+<script>renderGraphGL(document.getElementById("graph"), {payload});</script>
+</body></html>"""
+
+# Live vis.js network fed with the deltas from iter_build_graph. During a build
+# every push carries the whole history: a keyless component gets a new element
+# id (and a fresh frame) whenever its args change, so there is no earlier state
+# to add to. In explore mode (clickable) deltas[0] is number `offset` in the full history,
+# and clicking a node returns {"node", "click", "applied"}: the clicked id, a
+# click timestamp and how many deltas the frame holds, so the next render can
+# send only the rest.
+_graph_stream = st.components.v1.declare_component(
+    "graph_stream", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "graph_stream")
+)
+
+def _vis_delta(delta: dict) -> dict:
+    return {"nodes": [{"id": n, **_vis_node(n, a)} for n, a in delta["nodes"]],
+            "edges": [{"from": u, "to": v} for u, v in delta["edges"]]}
+
+def graph_delta(G: nx.Graph) -> dict:
+    # The whole graph as a single delta, to seed an explore view.
+    return {"nodes": list(G.nodes(data=True)), "edges": list(G.edges())}
+
+def stream_graph(deltas: list[dict], offset: int = 0, clickable: bool = False, key: str | None = None):
+    payload = [_vis_delta(d) for d in deltas]
+    return _graph_stream(deltas=payload, offset=offset, clickable=clickable, height=750, key=key, default=None)
@@ -0,0 +1,187 @@
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+# Central admission control for LLM calls. Every completion waits for a
+# concurrency slot, a request token and an estimated number of model tokens,
+# and is retried on rate limits and transient failures with jittered
+# exponential backoff. Concurrency adapts AIMD-style: it creeps up while calls
+# succeed and halves when the API answers 429. Configure with KG_RPM, KG_TPM,
+# KG_CONCURRENCY (initial), KG_MAX_CONCURRENCY and KG_MAX_RETRIES.
+
+
+class RateLimited(Exception):
+    def __init__(self, message: str = "rate limited", retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TransientError(Exception):
+    """A failure worth retrying: timeouts, dropped connections, 5xx responses."""
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n: float = 1) -> None:
+        n = min(n, self.capacity)  # a single oversized request must still be admissible
+        with self._cond:
+            while True:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                self._cond.wait((n - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, cooldown: float = 2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown  # one decrease per burst of 429s
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify()
+
+    def on_rate_limit(self) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+
+
+@dataclass
+class SchedulerStats:
+    calls: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    transient_errors: int = 0
+    failures: int = 0
+
+
+class RequestScheduler:
+    def __init__(self, rpm: float = 3500, tpm: float = 160_000, concurrency: int = 8, max_concurrency: int = 64,
+                 max_retries: int = 6, backoff_base: float = 0.5, backoff_cap: float = 30.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limiter = AdaptiveLimiter(concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.stats = SchedulerStats()
+        self._paused_until = 0.0  # set from retry-after so every caller backs off, not just the one that hit it
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        env = os.environ.get
+        return cls(
+            rpm=float(env("KG_RPM", 3500)),
+            tpm=float(env("KG_TPM", 160_000)),
+            concurrency=int(env("KG_CONCURRENCY", 8)),
+            max_concurrency=int(env("KG_MAX_CONCURRENCY", 64)),
+            max_retries=int(env("KG_MAX_RETRIES", 6)),
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform over [0, base * 2^attempt], capped.
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _wait_for_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def call(self, fn, tokens: int = 0):
+        """Run fn() under the rate limits, retrying RateLimited and TransientError."""
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_pause()
+            self.limiter.acquire()
+            try:
+                self.requests.acquire(1)
+                if tokens:
+                    self.tokens.acquire(tokens)
+                with self._lock:
+                    self.stats.calls += 1
+                result = fn()
+            except RateLimited as e:
+                self.limiter.on_rate_limit()
+                delay = e.retry_after if e.retry_after is not None else self._backoff(attempt)
+                with self._lock:
+                    self.stats.rate_limited += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                error = e
+            except TransientError as e:
+                delay = self._backoff(attempt)
+                with self._lock:
+                    self.stats.transient_errors += 1
+                error = e
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            if attempt == self.max_retries:
+                break
+            with self._lock:
+                self.stats.retries += 1
+            time.sleep(delay + random.uniform(0, 0.1 * delay))
+        with self._lock:
+            self.stats.failures += 1
+        raise error
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**asdict(self.stats), "concurrency_limit": round(self.limiter.limit, 1),
+                    "in_flight": self.limiter.in_flight}
+
+
+# Process-wide, like the persistent cache: shared by every session and rerun.
+_scheduler: RequestScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler.from_env()
+        return _scheduler
+
+
+def set_scheduler(scheduler: RequestScheduler) -> None:
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -0,0 +1,71 @@
+import threading
+from dataclasses import dataclass, asdict
+
+# In-process request coalescing. The first caller for a key runs the work;
+# callers that arrive while it is in flight wait for and share its result
+# (or its exception) instead of issuing the same completion again.
+
+
+@dataclass
+class FlightStats:
+    leaders: int = 0
+    collapsed: int = 0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self):
+        self.stats = FlightStats()
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> tuple[_Call, bool]:
+        """Return the call for key and whether this caller leads it.
+
+        A leader must finish() the key exactly once; everyone else waits on the call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats.collapsed += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.stats.leaders += 1
+            return call, True
+
+    def finish(self, key: str, result=None, error: BaseException | None = None) -> None:
+        with self._lock:
+            call = self._calls.pop(key)
+        call.result, call.error = result, error
+        call.done.set()
+
+    def do(self, key: str, fn):
+        call, leader = self.claim(key)
+        if not leader:
+            return call.wait()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result)
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**asdict(self.stats), "in_flight": len(self._calls)}
+
+
+flights = SingleFlight()
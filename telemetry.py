@@ -0,0 +1,239 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+
+# Per-call instrumentation for the LLM layer. Every completion and every
+# persistent-cache hit becomes a CallRecord tagged with the stage and relation
+# it served (seed ring, deep subtopics, 2nd-level related, ...). Records are
+# appended as JSON lines to KG_CALL_LOG (default calls.jsonl under
+# KG_CACHE_PATH, "none" to disable) and collected by the active Run, if any,
+# for a per-run summary.
+#
+# Tags and the active run live in context variables; work handed to a thread
+# pool keeps them when it is submitted through submit().
+
+# USD per million tokens (prompt, completion). Unknown models, including the
+# fake backend, are priced like gpt-3.5-turbo so offline runs estimate real spend.
+PRICES = {"gpt-3.5-turbo": (0.50, 1.50), "gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00)}
+DEFAULT_PRICE = PRICES["gpt-3.5-turbo"]
+
+
+@dataclass
+class CallRecord:
+    task: str
+    stage: str
+    rel: str | None
+    model: str
+    cached: bool = False
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0  # wall time including rate-limit waits and retries
+    api_latency: float = 0.0  # time spent inside backend calls
+    first_item: float | None = None  # streamed calls: seconds until the first complete item
+    attempts: int = 0
+    parse_failures: int = 0  # answers rejected by validation and asked again
+    hedged: bool = False  # a duplicate request was sent for this call
+    hedge_won: bool = False  # ... and answered first
+    hedge: bool = False  # this record is the losing request of a hedge: pure overhead
+    error: str | None = None
+    run: str | None = None
+    ts: float = field(default_factory=time.time)
+
+    @property
+    def cost(self) -> float:
+        p_in, p_out = PRICES.get(self.model, DEFAULT_PRICE)
+        return (self.prompt_tokens * p_in + self.completion_tokens * p_out) / 1e6
+
+    def absorb(self, other: "CallRecord") -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.attempts += other.attempts
+        self.api_latency += other.api_latency
+
+
+_tags: contextvars.ContextVar[dict] = contextvars.ContextVar("telemetry_tags", default={})
+_run: contextvars.ContextVar["Run | None"] = contextvars.ContextVar("telemetry_run", default=None)
+_call: contextvars.ContextVar[CallRecord | None] = contextvars.ContextVar("telemetry_call", default=None)
+
+
+@contextmanager
+def tags(**kw):
+    """Tag calls made inside the block, e.g. tags(stage="seed", rel="related")."""
+    token = _tags.set({**_tags.get(), **{k: v for k, v in kw.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def submit(pool, fn, *args, **kwargs):
+    # Executor threads do not inherit context variables, so carry ours over.
+    # Only ours: copying the whole context would also hand the worker
+    # Streamlit's script-run context, which must stay on the script thread.
+    tags_, run_, call_ = _tags.get(), _run.get(), _call.get()
+
+    def call():
+        t1, t2, t3 = _tags.set(tags_), _run.set(run_), _call.set(call_)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _call.reset(t3)
+            _run.reset(t2)
+            _tags.reset(t1)
+    return pool.submit(call)
+
+
+def tagged(fn, **kw):
+    """fn wrapped to run under tags(**kw), for handing to a pool."""
+    def run(*args, **kwargs):
+        with tags(**kw):
+            return fn(*args, **kwargs)
+    return run
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Run:
+    def __init__(self, name: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.records: list[CallRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, rec: CallRecord) -> None:
+        with self._lock:
+            self.records.append(rec)
+
+    def summary(self) -> list[dict]:
+        """One row per (stage, relation): calls, cache hits, tokens, cost, latency."""
+        with self._lock:
+            records = list(self.records)
+        groups: dict[tuple, list[CallRecord]] = {}
+        for r in records:
+            groups.setdefault((r.stage, r.rel or "-"), []).append(r)
+        rows = []
+        for (stage, rel), recs in sorted(groups.items()):
+            calls = [r for r in recs if not r.cached and not r.hedge]
+            hedges = [r for r in recs if r.hedge]
+            lat = [r.latency for r in calls]
+            rows.append({
+                "stage": stage, "rel": rel, "calls": len(calls), "cache_hits": len(recs) - len(calls),
+                "retries": sum(max(0, r.attempts - 1) for r in calls),
+                "errors": sum(r.error is not None for r in calls),
+                "parse_failures": sum(r.parse_failures for r in calls),
+                "prompt_tokens": sum(r.prompt_tokens for r in calls + hedges),
+                "completion_tokens": sum(r.completion_tokens for r in calls + hedges),
+                "hedged": sum(r.hedged for r in calls), "hedge_wins": sum(r.hedge_won for r in calls),
+                "cost_usd": round(sum(r.cost for r in calls + hedges), 6),
+                "hedge_cost_usd": round(sum(r.cost for r in hedges), 6),
+                "p50_s": round(_percentile(lat, 0.5), 3), "p95_s": round(_percentile(lat, 0.95), 3),
+            })
+        return rows
+
+    def totals(self) -> dict:
+        rows = self.summary()
+        keys = ("calls", "cache_hits", "retries", "errors", "parse_failures", "prompt_tokens", "completion_tokens",
+                "hedged", "hedge_wins", "cost_usd", "hedge_cost_usd")
+        return {k: round(sum(r[k] for r in rows), 6) for k in keys}
+
+
+@contextmanager
+def run(name: str = ""):
+    r = Run(name)
+    token = _run.set(r)
+    try:
+        yield r
+    finally:
+        _run.reset(token)
+
+
+# ─── LOG SINK ───────────────────────────────────────────
+_log_lock = threading.Lock()
+_log_file = None
+
+
+def _log(rec: CallRecord) -> None:
+    global _log_file
+    path = os.environ.get("KG_CALL_LOG") or os.path.join(os.environ.get("KG_CACHE_PATH", ".kg_cache"),
+                                                          "calls.jsonl")
+    if path.lower() == "none":
+        return
+    line = json.dumps({**asdict(rec), "cost": round(rec.cost, 8)})
+    with _log_lock:
+        if _log_file is None or _log_file.name != path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _log_file = open(path, "a", encoding="utf-8")
+        _log_file.write(line + "\n")
+        _log_file.flush()
+
+
+def emit(rec: CallRecord) -> None:
+    r = _run.get()
+    if r is not None:
+        rec.run = r.id
+        r.add(rec)
+    _log(rec)
+
+
+# ─── RECORDING ──────────────────────────────────────────
+@contextmanager
+def track_call(task: str, model: str, rel: str | None = None):
+    """Time one completion (with its retries); backends report usage() inside it."""
+    t = _tags.get()
+    rec = CallRecord(task, t.get("stage", "other"), rel or t.get("rel"), model)
+    token = _call.set(rec)
+    started = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec.error = type(e).__name__
+        raise
+    finally:
+        rec.latency = time.perf_counter() - started
+        _call.reset(token)
+        emit(rec)
+
+
+@contextmanager
+def recording(rec: CallRecord):
+    """Send attempt() and usage() inside the block to rec instead of the current call."""
+    token = _call.set(rec)
+    try:
+        yield rec
+    finally:
+        _call.reset(token)
+
+
+@contextmanager
+def attempt():
+    # One backend call inside track_call; the scheduler may make several.
+    rec = _call.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if rec is not None:
+            rec.attempts += 1
+            rec.api_latency += time.perf_counter() - started
+
+
+def usage(prompt_tokens: int, completion_tokens: int) -> None:
+    rec = _call.get()
+    if rec is not None:
+        rec.prompt_tokens += prompt_tokens
+        rec.completion_tokens += completion_tokens
+
+
+def cache_hit(task: str, model: str) -> None:
+    t = _tags.get()
+    emit(CallRecord(task, t.get("stage", "other"), t.get("rel"), model, cached=True))
@@ -0,0 +1,50 @@
+import os
+
+os.environ.setdefault("KG_CALL_LOG", "none")
+
+import pytest
+
+import llm
+from breaker import CircuitBreaker, CircuitOpen, get_breaker, set_breaker
+from fake_llm import FakeLLMBackend, FakeLLMError
+from scheduler import RequestScheduler, set_scheduler
+
+
+class _Failing(FakeLLMBackend):
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    def complete(self, req):
+        raise self.error
+
+
+@pytest.fixture(autouse=True)
+def fresh():
+    set_breaker(CircuitBreaker(failures=3, cooldown=60))
+    set_scheduler(RequestScheduler(max_retries=0))
+    yield
+    llm.set_llm_backend(None)
+    set_breaker(None)
+    set_scheduler(None)
+
+
+def _ask():
+    return llm._complete("s", "p", 0, "neighbors", term="t", rel="related", limit=3)
+
+
+def test_transient_errors_open_the_breaker():
+    llm.set_llm_backend(_Failing(FakeLLMError("down")))
+    for _ in range(3):
+        with pytest.raises(FakeLLMError):
+            _ask()
+    with pytest.raises(CircuitOpen):
+        _ask()
+
+
+def test_other_errors_do_not_open_the_breaker():
+    llm.set_llm_backend(_Failing(PermissionError("bad key")))
+    for _ in range(5):
+        with pytest.raises(PermissionError):
+            _ask()
+    assert get_breaker().snapshot()["state"] == "closed"
@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+
+os.environ.setdefault("KG_CALL_LOG", "none")
+
+import pytest
+import streamlit as st
+
+import jobs
+import llm
+import persistent_cache
+from breaker import CircuitBreaker, set_breaker
+from fake_llm import FakeLLMBackend, FakeLLMError
+from jobs import JobStore, run_job
+from scheduler import RequestScheduler, set_scheduler
+
+
+class _Outage(FakeLLMBackend):
+    # Fails every call until `down` calls have been refused; topics in `broken`
+    # always fail with an error that is not an outage.
+    def __init__(self, down: int = 0):
+        super().__init__(seed=3)
+        self.model = "fake-llm-outage"
+        self.down = down
+        self.broken: set[str] = set()
+
+    def complete(self, req):
+        with self._lock:
+            self.calls += 1
+            if self.down > 0:
+                self.down -= 1
+                raise FakeLLMError("down")
+        if req.params.get("topic") in self.broken:
+            raise PermissionError("refused")
+        return json.dumps(self.answer(req))
+
+
+class _StopAfter(JobStore):
+    # Sets `stop` once `chunks` chunks have been committed.
+    def __init__(self, path, stop, chunks):
+        super().__init__(path)
+        self.stop, self.chunks = stop, chunks
+
+    def commit(self, jid, rows):
+        super().commit(jid, rows)
+        self.chunks -= 1
+        if not self.chunks:
+            self.stop.set()
+
+
+class _CrashAfter(JobStore):
+    # Raises instead of committing once `chunks` chunks have been committed.
+    def __init__(self, path, chunks):
+        super().__init__(path)
+        self.chunks = chunks
+
+    def commit(self, jid, rows):
+        if not self.chunks:
+            raise RuntimeError("crash")
+        super().commit(jid, rows)
+        self.chunks -= 1
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    fake = _Outage()
+    llm.set_llm_backend(fake)
+    persistent_cache.set_backend(persistent_cache.NullCache())
+    set_breaker(CircuitBreaker(failures=2, cooldown=0.05))
+    set_scheduler(RequestScheduler(max_retries=0))
+    monkeypatch.setattr(jobs, "OUTAGE_WAIT", 0.01)
+    st.cache_data.clear()
+    yield fake
+    llm.set_llm_backend(None)
+    persistent_cache.set_backend(None)
+    set_breaker(None)
+    set_scheduler(None)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+TOPICS = [f"topic {i}" for i in range(7)]
+
+
+def test_outage_rows_are_retried_not_committed_as_errors(backend, store):
+    backend.down = 4
+    jid = store.create(TOPICS, fused=True)
+    run_job(store, jid, max_workers=2, chunk_size=3)
+    assert store.progress(jid) == {"total": 7, "done": 7, "errors": 0, "finished": True}
+    assert [r["Topic"] for r in store.rows(jid)] == TOPICS
+
+
+def test_chunks_are_committed_until_finished(backend, store):
+    jid = store.create(TOPICS, fused=True)
+    assert store.progress(jid) == {"total": 7, "done": 0, "errors": 0, "finished": False}
+    run_job(store, jid, max_workers=2, chunk_size=3)
+    assert store.progress(jid) == {"total": 7, "done": 7, "errors": 0, "finished": True}
+    assert [r["Topic"] for r in store.iter_rows(jid, page=2)] == TOPICS
+    assert backend.calls == 7
+    assert store.create(TOPICS, fused=True) == jid  # resubmitting finds the same job
+
+
+def test_stopped_job_resumes_after_the_committed_chunks(backend, tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    stop = threading.Event()
+    store = _StopAfter(path, stop, chunks=1)
+    jid = store.create(TOPICS, fused=True)
+    run_job(store, jid, max_workers=2, chunk_size=3, stop=stop)
+    assert store.progress(jid)["done"] == 3
+    calls = backend.calls
+    run_job(JobStore(path), jid, max_workers=2, chunk_size=3)
+    assert backend.calls - calls == 4  # the committed chunk is not redone
+    assert [r["Topic"] for r in JobStore(path).rows(jid)] == TOPICS
+
+
+def test_crashed_job_resumes_from_the_first_uncommitted_chunk(backend, tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = _CrashAfter(path, chunks=2)
+    jid = store.create(TOPICS, fused=True)
+    with pytest.raises(RuntimeError):
+        run_job(store, jid, max_workers=2, chunk_size=3)
+    assert store.progress(jid)["done"] == 6
+    calls = backend.calls
+    reopened = JobStore(path)
+    run_job(reopened, jid, max_workers=2, chunk_size=3)
+    assert backend.calls - calls == 1
+    assert reopened.progress(jid) == {"total": 7, "done": 7, "errors": 0, "finished": True}
+
+
+def test_retry_errors_reruns_only_the_failed_rows(backend, store):
+    backend.broken = {"topic 1", "topic 5"}
+    jid = store.create(TOPICS, fused=True)
+    run_job(store, jid, max_workers=2, chunk_size=3)
+    assert store.progress(jid) == {"total": 7, "done": 7, "errors": 2, "finished": True}
+    assert "refused" in store.rows(jid)[1]["Error"]
+
+    backend.broken = set()
+    assert store.retry_errors(jid) == 2
+    assert store.progress(jid) == {"total": 7, "done": 5, "errors": 0, "finished": False}
+    calls = backend.calls
+    run_job(store, jid, max_workers=2, chunk_size=3)
+    assert backend.calls - calls == 2
+    assert store.progress(jid) == {"total": 7, "done": 7, "errors": 0, "finished": True}
+    assert not any("Error" in r for r in store.rows(jid))
@@ -0,0 +1,24 @@
+import json
+
+from jsonstream import ArrayItemParser
+
+
+def _stream(text: str, step: int = 3) -> list[str]:
+    parser, items = ArrayItemParser(), []
+    for i in range(0, len(text), step):
+        items += parser.feed(text[i:i + step])
+    return items
+
+
+def test_root_array():
+    assert _stream('["a", "b \\"c\\"", "d"] trailing ["x"]') == ["a", 'b "c"', "d"]
+
+
+def test_items_array_only():
+    text = json.dumps({"note": ["not", "these"], "meta": {"items": ["nor", "these"]},
+                       "label": "items", "items": ["a", "b"]})
+    assert _stream(text) == ["a", "b"]
+
+
+def test_no_items_key():
+    assert _stream('{"other": ["a", "b"]}') == []
@@ -0,0 +1,28 @@
+import os
+
+os.environ.setdefault("KG_CALL_LOG", "none")
+
+import pytest
+
+import llm
+import persistent_cache
+from fake_llm import FakeLLMBackend
+from graph import build_graph
+
+
+@pytest.fixture(autouse=True)
+def backend():
+    llm.set_llm_backend(FakeLLMBackend(seed=5))
+    persistent_cache.set_backend(persistent_cache.NullCache())
+    yield
+    llm.set_llm_backend(None)
+    persistent_cache.set_backend(None)
+
+
+@pytest.mark.parametrize("budget", [20, 40])
+def test_node_budget_counts_the_same_nodes_with_and_without_streaming(budget):
+    args = ("data", 3, 6, 6, 0, True, 4)
+    plain = build_graph(*args, node_budget=budget)
+    streamed = build_graph(*args, node_budget=budget, stream=True)
+    assert plain.number_of_nodes() == streamed.number_of_nodes() == budget
+    assert set(plain) == set(streamed)
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+import time
+
+os.environ.setdefault("KG_CALL_LOG", "none")
+
+import pytest
+
+import persistent_cache
+from persistent_cache import SQLiteCache, ShardedFileCache, make_key, persistent
+from singleflight import flights
+
+
+@pytest.fixture(params=["sqlite", "shard"])
+def backend(request, tmp_path):
+    # One shard, so the sharded cache's per-shard LRU cap is max_entries.
+    if request.param == "sqlite":
+        return SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    return ShardedFileCache(str(tmp_path / "shards"), shards=1, max_entries=3)
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    persistent_cache.set_backend(backend)
+    yield backend
+    persistent_cache.set_backend(None)
+
+
+def test_refresh_flight_shares_the_new_value(sqlite):
+    sqlite.refresh_after = 0.01
+    gate = threading.Event()
+    answers = iter(["old", "new"])
+
+    @persistent("refreshed")
+    def answer(x):
+        gate.wait(5)
+        return next(answers)
+
+    gate.set()
+    assert answer(1) == "old"
+    time.sleep(0.05)
+    gate.clear()
+    assert answer(1) == "old"  # stale: served as it is, refreshed in the background
+    deadline = time.monotonic() + 5
+    while not flights.snapshot()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    joined = {}
+    t = threading.Thread(target=lambda: joined.update(v=flights.do(answer.key_for(1), lambda: "not the leader")))
+    t.start()
+    gate.set()
+    t.join(5)
+    assert joined["v"] == "new"
+
+
+def test_smallest_superset_is_served(backend):
+    family = make_key("family")
+    for size in (3, 8, 5):
+        backend.set(make_key("member", size), list(range(size)), family, size)
+    assert backend.get_at_least(family, 4) == list(range(5))
+    assert backend.get_at_least(family, 5) == list(range(5))
+    assert backend.stats.superset_hits == 1
+    assert backend.get_at_least(family, 9) is None
+    assert backend.get_at_least(make_key("other"), 1) is None
+
+
+def test_smaller_limits_are_sliced_from_the_cached_answer(backend):
+    persistent_cache.set_backend(backend)
+    calls = []
+
+    @persistent("sliced", limit_arg="limit")
+    def answer(term, limit):
+        calls.append(limit)
+        return [f"{term} {i}" for i in range(limit)]
+
+    try:
+        assert answer("t", 5) == [f"t {i}" for i in range(5)]
+        assert answer("t", 2) == ["t 0", "t 1"]
+        assert answer("t", 6) == [f"t {i}" for i in range(6)]
+        assert calls == [5, 6]
+    finally:
+        persistent_cache.set_backend(None)
+
+
+def test_expired_entries_are_purged(backend):
+    backend.ttl = 0.05
+    family = make_key("family")
+    backend.set(make_key("plain"), "v")
+    backend.set(make_key("member"), ["a", "b"], family, 2)
+    assert backend.get(make_key("plain")) == "v"
+    time.sleep(0.1)
+    assert backend.get(make_key("plain")) is None
+    assert backend.get_at_least(family, 1) is None
+    assert backend.stats.expired == 2
+    assert len(backend) == 0
+
+
+def test_least_recently_used_entry_is_evicted(backend):
+    keys = [make_key("k", i) for i in range(4)]
+    for k in keys[:3]:
+        backend.set(k, k)
+        time.sleep(0.01)
+    assert backend.get(keys[0]) == keys[0]  # now more recent than keys[1]
+    time.sleep(0.01)
+    backend.set(keys[3], keys[3])
+    assert len(backend) == 3
+    assert backend.stats.evictions == 1
+    assert backend.get(keys[1]) is None
+    assert all(backend.get(k) == k for k in (keys[0], keys[2], keys[3]))
+
+
+def test_sqlite_tables_without_families_are_migrated_in_place(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE entries ("
+                 " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+    now = time.time()
+    conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?)", (make_key("old"), '["kept"]', now, now))
+    conn.commit()
+    conn.close()
+
+    cache = SQLiteCache(path)
+    columns = {row[1] for row in cache._conn.execute("PRAGMA table_info(entries)")}
+    assert {"family", "size"} <= columns
+    assert cache.get(make_key("old")) == ["kept"]
+    family = make_key("family")
+    cache.set(make_key("new"), ["a", "b", "c"], family, 3)
+    assert cache.get_at_least(family, 2) == ["a", "b", "c"]
+    assert SQLiteCache(path).get(make_key("old")) == ["kept"]  # reopening does not migrate again
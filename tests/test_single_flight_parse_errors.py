@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+
+os.environ.setdefault("KG_CALL_LOG", "none")
+
+import pytest
+
+import llm
+import persistent_cache
+from fake_llm import FakeLLMBackend
+from graph import fetch_frontier
+
+
+class _SlowMalformed(FakeLLMBackend):
+    # "x" answers garbage, and only once a batch has joined its flight.
+    def __init__(self):
+        super().__init__(seed=7)
+        self.model = "fake-llm-slow-malformed"
+        self.x_started = threading.Event()
+        self.batch_sent = threading.Event()
+
+    def complete(self, req):
+        if req.task == "neighbors" and req.params["term"] == "x":
+            self.x_started.set()
+            self.batch_sent.wait(10)
+            return "Sure! Here are some ideas:\n- x"
+        if req.task == "neighbors_batch":
+            self.batch_sent.set()
+        return json.dumps(self.answer(req))
+
+
+@pytest.fixture
+def backend():
+    fake = _SlowMalformed()
+    llm.set_llm_backend(fake)
+    persistent_cache.set_backend(persistent_cache.NullCache())
+    yield fake
+    llm.set_llm_backend(None)
+    persistent_cache.set_backend(None)
+
+
+def test_batch_waiting_on_a_failed_flight_keeps_the_other_answers(backend):
+    leader_error = []
+
+    def leader():
+        try:
+            llm._llm_neighbors("x", "related", 5)
+        except llm.ParseError as e:
+            leader_error.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    assert backend.x_started.wait(10)
+    results = fetch_frontier([("x", "related", 5), ("y", "related", 5), ("z", "related", 5)], batch_size=3)
+    thread.join(10)
+
+    assert leader_error
+    assert results[("x", "related", 5)] == []
+    assert results[("y", "related", 5)] and results[("z", "related", 5)]